@@ -0,0 +1,197 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from circuit_breaker import ErrorCode
+
+NO_ERROR = -1  # Stored in place of error_code None
+
+HEADER_DTYPE = np.dtype([
+    ("packet_id", np.int64),
+    ("timestamp", np.float64),
+    ("protocol_version", "U8"),
+    ("error_code", np.int32),
+    ("source", "U64"),
+])
+
+# Result bits, so one array says why each packet was rejected
+VERSION_MISMATCH = 1
+TIMESTAMP_SKEW = 2
+OUTSIDE_WINDOW = 4
+DUPLICATE = 8
+ERROR_REPORTED = 16
+
+
+def headers_to_array(packets: list) -> np.ndarray:
+    """
+    Loads the headers of a batch of packets into a structured array.
+    """
+    return np.array(
+        [
+            (
+                packet.get("packet_id", -1),
+                packet.get("timestamp", 0),
+                packet.get("protocol_version", ""),
+                NO_ERROR if packet.get("error_code") is None else packet["error_code"],
+                packet.get("source", ""),
+            )
+            for packet in packets
+        ],
+        dtype=HEADER_DTYPE,
+    )
+
+
+class BatchValidator:
+    """
+    Vectorized header checks for a received batch: protocol version, timestamp skew,
+    membership in the sender's sliding packet-ID window (including duplicates) and reported error codes.
+    Each source has its own window, since packet IDs are per-sender counters. A window only moves
+    forward for packets that passed the other checks, and never by more than max_jump IDs past its
+    top, so a single forged header cannot push legitimate traffic out of the window.
+    """
+
+    def __init__(self, protocol_version: str = "1.0", max_skew: float = 30.0, window_size: int = 4096,
+                 max_jump: int = None, max_sources: int = 4096):
+        self.protocol_version = protocol_version
+        self.max_skew = max_skew
+        self.window_size = window_size
+        self.max_jump = window_size if max_jump is None else max_jump
+        self.max_sources = max_sources
+        # source -> [lowest packet ID still accepted, seen flags indexed by packet_id % window_size]
+        self.windows = OrderedDict()
+
+    def validate(self, headers: np.ndarray, now: float = None) -> np.ndarray:
+        """
+        Returns a bitmask per packet; zero means the packet passed every check.
+        """
+        if now is None:
+            now = time.time()
+        result = np.zeros(len(headers), dtype=np.uint8)
+
+        result[headers["protocol_version"] != self.protocol_version] |= VERSION_MISMATCH
+        result[np.abs(headers["timestamp"] - now) > self.max_skew] |= TIMESTAMP_SKEW
+        result[headers["error_code"] != NO_ERROR] |= ERROR_REPORTED
+
+        # Group packet indices by source; a batch usually holds only a few sources
+        sources, inverse, counts = np.unique(headers["source"], return_inverse=True, return_counts=True)
+        groups = np.split(np.argsort(inverse, kind="stable"), np.cumsum(counts)[:-1])
+        for source, index in zip(sources.tolist(), groups):
+            result[index] |= self._check_window(source, headers["packet_id"][index], result[index] == 0)
+        return result
+
+    def reset(self, source: str):
+        """
+        Forgets a source's window, e.g. after the peer restarted and its packet IDs began again.
+        """
+        self.windows.pop(source, None)
+
+    def _check_window(self, source: str, ids: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        bits = np.zeros(len(ids), dtype=np.uint8)
+        window = self.windows.get(source)
+        if window is None:
+            if not valid.any():
+                return bits  # Already rejected by the other checks; do not start a window from them
+            window = self.windows[source] = [int(ids[valid].min()), np.zeros(self.window_size, dtype=bool)]
+            if len(self.windows) > self.max_sources:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(source)
+
+        # Slide the window forward so the newest acceptable ID fits, within the jump limit
+        low, seen = window
+        limit = low + self.window_size + self.max_jump
+        movers = ids[valid & (ids >= low) & (ids < limit)]
+        newest = int(movers.max()) if len(movers) else low
+        if newest >= low + self.window_size:
+            self._advance(window, newest - self.window_size + 1)
+            low = window[0]
+
+        in_window = (ids >= low) & (ids < low + self.window_size)
+        bits[~in_window] |= OUTSIDE_WINDOW
+
+        # Duplicates: already seen before this batch, or repeated inside it
+        slots = ids % self.window_size
+        duplicate = in_window & seen[slots]
+        _, first_index = np.unique(ids, return_index=True)
+        repeated = np.ones(len(ids), dtype=bool)
+        repeated[first_index] = False
+        bits[duplicate | (repeated & in_window)] |= DUPLICATE
+
+        accepted = valid & in_window & ~duplicate & ~repeated
+        seen[slots[accepted]] = True
+        return bits
+
+    def _advance(self, window: list, new_low: int):
+        # Clear the slots of IDs that fall out of the window; they will be reused by new IDs
+        low, seen = window
+        dropped = min(new_low - low, self.window_size)
+        cleared = (np.arange(dropped) + low) % self.window_size
+        seen[cleared] = False
+        window[0] = new_low
+
+
+class TrafficStatistics:
+    """
+    Running intrusion-detection counters computed from the same header arrays.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.rejected = 0
+        self.error_counts = {}  # error code name -> count
+        self.rejections_by_source = {}  # source -> rejected packets
+        self.max_skew_seen = 0.0
+
+    def update(self, headers: np.ndarray, result: np.ndarray, now: float = None):
+        """
+        Folds one validated batch into the counters.
+        """
+        if now is None:
+            now = time.time()
+        self.packets += len(headers)
+        rejected = result != 0
+        self.rejected += int(rejected.sum())
+        if len(headers):
+            self.max_skew_seen = max(self.max_skew_seen, float(np.abs(headers["timestamp"] - now).max()))
+
+        codes, counts = np.unique(headers["error_code"][headers["error_code"] != NO_ERROR], return_counts=True)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            name = ErrorCode(code).name if code in ErrorCode._value2member_map_ else str(code)
+            self.error_counts[name] = self.error_counts.get(name, 0) + count
+
+        sources, counts = np.unique(headers["source"][rejected], return_counts=True)
+        for source, count in zip(sources.tolist(), counts.tolist()):
+            self.rejections_by_source[source] = self.rejections_by_source.get(source, 0) + count
+
+    def suspicious_sources(self, threshold: int = 100) -> list:
+        """
+        Returns sources whose rejected packet count has reached the threshold.
+        """
+        return [source for source, count in self.rejections_by_source.items() if count >= threshold]
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, protocol_version: str = "1.0"):
+        # ... existing code ...
+        self.batch_validator = BatchValidator(protocol_version)
+        self.traffic_stats = TrafficStatistics()
+
+    def receive_batch(self, packets: list) -> list:
+        """
+        Validates the headers of a whole batch at once and returns the packets that passed,
+        after running each of them through receive_packet.
+        """
+        if not packets:
+            return []
+        now = time.time()
+        headers = headers_to_array(packets)
+        result = self.batch_validator.validate(headers, now)
+        self.traffic_stats.update(headers, result, now)
+
+        rejected = np.flatnonzero(result)
+        if len(rejected):
+            print(f"Rejected {len(rejected)} of {len(packets)} packets in batch")
+        return [self.receive_packet(packets[i]) for i in np.flatnonzero(result == 0).tolist()]
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+
+class ErrorCode(Enum):
+    CONNECTION_REFUSED = 100
+    TIMEOUT = 101
+    INVALID_DATA = 102
+    PROTOCOL_VERSION_MISMATCH = 103
+    UNKNOWN_ERROR = 104
+    UNAUTHORIZED_ACCESS = 105
+    CIRCUIT_OPEN = 106  # New error code for sends rejected by an open circuit breaker
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one destination over a rolling time window.
+    Only transport failures (connection refused, timeout) count towards opening the circuit.
+    All methods may be called from several threads at once.
+    """
+
+    TRIPPING_ERRORS = (ErrorCode.CONNECTION_REFUSED.value, ErrorCode.TIMEOUT.value)
+
+    def __init__(self, window: float = 30.0, failure_threshold: float = 0.5, min_requests: int = 5,
+                 open_timeout: float = 10.0, half_open_probes: int = 1, probe_timeout: float = 30.0):
+        self.window = window  # Seconds of history used to compute the error rate
+        self.failure_threshold = failure_threshold  # Error rate that opens the circuit
+        self.min_requests = min_requests  # Requests needed in the window before the rate is trusted
+        self.open_timeout = open_timeout  # Seconds to stay open before letting a probe through
+        self.half_open_probes = half_open_probes
+        self.probe_timeout = probe_timeout  # Seconds after which an unanswered probe counts as failed
+        self.probe_started = 0.0
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.results = deque()  # (timestamp, error_code or None)
+        self.failures = 0  # Tripping errors currently in the window
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        Returns True if a send to this destination should be attempted now.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.state is CircuitState.OPEN:
+                if now - self.opened_at < self.open_timeout:
+                    return False
+                self.state = CircuitState.HALF_OPEN
+                self.probes_in_flight = 0
+
+            if self.state is CircuitState.HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    if now - self.probe_started >= self.probe_timeout:
+                        self._open(now)  # The probe never reported back; treat it as failed
+                    return False
+                if not self.probes_in_flight:
+                    self.probe_started = now
+                self.probes_in_flight += 1
+
+            return True
+
+    def record(self, error_code: int = None):
+        """
+        Records the outcome of a send; error_code is None on success.
+        """
+        now = time.monotonic()
+        failed = error_code in self.TRIPPING_ERRORS
+
+        with self.lock:
+            if self.state is CircuitState.HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CircuitState.CLOSED
+                    self.results.clear()
+                    self.failures = 0
+                return
+
+            self.results.append((now, error_code))
+            self.failures += failed
+            self._trim(now)
+            if self.state is CircuitState.CLOSED and self._error_rate() >= self.failure_threshold \
+                    and len(self.results) >= self.min_requests:
+                self._open(now)
+
+    def error_rate(self) -> float:
+        """
+        Returns the fraction of requests in the window that failed with a tripping error.
+        """
+        with self.lock:
+            return self._error_rate()
+
+    def _error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return self.failures / len(self.results)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current state and per-error-code counts for reporting.
+        """
+        with self.lock:
+            self._trim(time.monotonic())
+            errors = {}
+            for _, code in self.results:
+                if code is not None:
+                    name = ErrorCode(code).name if code in ErrorCode._value2member_map_ else str(code)
+                    errors[name] = errors.get(name, 0) + 1
+            return {
+                "state": self.state.value,
+                "requests": len(self.results),
+                "error_rate": self._error_rate(),
+                "errors": errors,
+            }
+
+    def _open(self, now: float):
+        self.state = CircuitState.OPEN
+        self.opened_at = now
+
+    def _trim(self, now: float):
+        while self.results and now - self.results[0][0] > self.window:
+            _, code = self.results.popleft()
+            self.failures -= code in self.TRIPPING_ERRORS
+
+
+class AdvancedCommunicationProtocol:
+    MAX_RETRIES = 3  # Maximum number of retries
+    INITIAL_DELAY = 1  # Initial delay in seconds
+    BACKOFF_MULTIPLIER = 2  # Factor by which the delay increases each time
+
+    # ... existing code ...
+
+    def __init__(self):
+        # ... existing code ...
+        self.circuit_breakers = {}  # destination -> CircuitBreaker
+
+    def circuit_breaker(self, destination: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker for a destination, creating it on first use.
+        Concurrent first sends to a destination all get the same breaker.
+        """
+        breaker = self.circuit_breakers.get(destination)
+        if breaker is None:
+            breaker = self.circuit_breakers.setdefault(destination, CircuitBreaker())
+        return breaker
+
+    def destination_health(self) -> dict:
+        """
+        Returns the circuit state and recent error counts of every known destination.
+        """
+        return {destination: breaker.snapshot() for destination, breaker in list(self.circuit_breakers.items())}
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination, retrying up to MAX_RETRIES times if an error occurs.
+        Fails fast without retrying while the destination's circuit is open.
+        """
+        breaker = self.circuit_breaker(destination)
+        if not breaker.allow_request():
+            packet["error_code"] = ErrorCode.CIRCUIT_OPEN.value
+            print(f"Circuit open for {destination}, not sending packet {packet.get('packet_id')}")
+            return
+
+        try:
+            # ... existing code ...
+            self.transmit(self.encrypt_data(packet), destination)
+        except Exception:
+            # A send that raises is a transport failure; recording it also releases a half-open probe
+            breaker.record(ErrorCode.CONNECTION_REFUSED.value)
+            raise
+
+        breaker.record(packet.get("error_code"))
+
+        # If an error occurs and we haven't reached the maximum number of retries, retry sending the packet
+        if packet.get("error_code") is not None and retries < self.MAX_RETRIES:
+            delay = self.INITIAL_DELAY * (self.BACKOFF_MULTIPLIER ** retries)
+            print(f"Error occurred while sending packet, retrying in {delay} seconds ({retries + 1}/{self.MAX_RETRIES})...")
+            time.sleep(delay)  # Wait before retrying
+            packet["error_code"] = None
+            self.send_packet(packet, destination, retries + 1)
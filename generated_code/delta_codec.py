@@ -0,0 +1,392 @@
+import json
+import random
+import struct
+import time
+
+# Frame flags (first byte); the second byte is the stream sequence number, modulo 256
+FLAG_KEYFRAME = 0x01  # Stream state was reset; the frame carries every header field and data field
+FLAG_VERSION = 0x02  # protocol_version follows (always set in keyframes)
+FLAG_ERROR = 0x04  # error_code follows
+FLAG_KEYFRAME_REQUEST = 0x80  # Control frame from the receiver: send a keyframe next
+KEYFRAME_REQUEST = bytes((FLAG_KEYFRAME_REQUEST, 0))
+
+# Value tags for changed data fields
+TAG_INT = 0  # zigzag varint
+TAG_INT_DELTA = 1  # zigzag varint difference from the field's previous int value
+TAG_FLOAT = 2
+TAG_STR = 3
+TAG_BYTES = 4
+TAG_JSON = 5  # Anything else (bool, None, lists, nested dicts) as compact JSON
+TAG_DELETE = 6  # Field no longer present
+DOUBLE = struct.Struct("!d")
+SCALAR_TYPES = (int, float, str, bytes)
+
+_MISSING = object()
+
+
+class _Json(bytes):
+    """
+    Compact JSON encoding of a non-scalar field value, kept in the stream state instead of the
+    value itself so in-place changes to nested objects are still detected.
+    """
+
+
+def zigzag(value: int) -> int:
+    """
+    Maps signed integers to unsigned ones so small negative deltas stay small.
+    """
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def write_varint(value: int, out: bytearray):
+    """
+    Appends an unsigned LEB128 varint.
+    """
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(frame: bytes, offset: int) -> tuple:
+    """
+    Returns (value, offset after the varint).
+    """
+    value = shift = 0
+    while True:
+        byte = frame[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class StreamState:
+    """
+    Reference state shared by the two ends of one stream: the last header values,
+    the field name table and the last value of every data field.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.reset()
+
+    def reset(self):
+        self.protocol_version = None
+        self.packet_id = 0
+        self.timestamp_ms = 0
+        self.keys = []
+        self.key_index = {}  # field name -> index in keys
+        self.reference = {}  # field name -> last value (_Json for non-scalar values)
+
+
+class DeltaEncoder:
+    """
+    Encodes the packets of one stream (one destination) against the previous packet.
+    Header fields become varint deltas, data fields are sent only when they change, and field
+    names are sent once and then referred to by index. Every keyframe_interval frames, or when
+    the receiver asks for one, a keyframe resets the state so a receiver can resync after loss.
+    """
+
+    def __init__(self, keyframe_interval: int = 32):
+        self.keyframe_interval = keyframe_interval
+        self.state = StreamState()
+        self.since_keyframe = keyframe_interval  # The first frame is always a keyframe
+
+    def request_keyframe(self):
+        """
+        Makes the next frame a keyframe.
+        """
+        self.since_keyframe = self.keyframe_interval
+
+    def encode(self, packet: dict) -> bytes:
+        """
+        Encodes a packet (header fields and plaintext data dict) as a delta frame.
+        """
+        state = self.state
+        out = bytearray(2)
+        flags = 0
+        if self.since_keyframe >= self.keyframe_interval:
+            state.reset()
+            self.since_keyframe = 0
+            flags |= FLAG_KEYFRAME
+        self.since_keyframe += 1
+
+        version = packet.get("protocol_version")
+        if version != state.protocol_version:
+            flags |= FLAG_VERSION
+            self._write_bytes(str(version).encode("utf-8"), out)
+            state.protocol_version = version
+        packet_id = packet["packet_id"]
+        write_varint(zigzag(packet_id - state.packet_id), out)
+        state.packet_id = packet_id
+        timestamp_ms = round(packet["timestamp"] * 1000)
+        write_varint(zigzag(timestamp_ms - state.timestamp_ms), out)
+        state.timestamp_ms = timestamp_ms
+        if packet.get("error_code") is not None:
+            flags |= FLAG_ERROR
+            write_varint(packet["error_code"], out)
+
+        self._encode_fields(packet["data"], out)
+        out[0] = flags
+        out[1] = state.sequence
+        state.sequence = (state.sequence + 1) & 0xFF
+        return bytes(out)
+
+    def _encode_fields(self, data: dict, out: bytearray):
+        reference = self.state.reference
+        changes = []
+        for key, value in data.items():
+            stored = value if type(value) in SCALAR_TYPES else _Json(
+                json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+            old = reference.get(key, _MISSING)
+            if old is _MISSING or type(old) is not type(stored) or old != stored:
+                changes.append((key, old, stored))
+        removed = [key for key in reference if key not in data]
+
+        write_varint(len(changes) + len(removed), out)
+        for key, old, stored in changes:
+            self._write_key(key, out)
+            self._write_value(old, stored, out)
+            reference[key] = stored
+        for key in removed:
+            self._write_key(key, out)
+            out.append(TAG_DELETE)
+            del reference[key]
+
+    def _write_key(self, key: str, out: bytearray):
+        state = self.state
+        index = state.key_index.get(key)
+        if index is None:
+            # A new name is sent inline the first time, right after the next free index
+            index = state.key_index[key] = len(state.keys)
+            state.keys.append(key)
+            write_varint(index, out)
+            self._write_bytes(key.encode("utf-8"), out)
+        else:
+            write_varint(index, out)
+
+    def _write_value(self, old, value, out: bytearray):
+        kind = type(value)
+        if kind is int:
+            if type(old) is int:
+                out.append(TAG_INT_DELTA)
+                write_varint(zigzag(value - old), out)
+            else:
+                out.append(TAG_INT)
+                write_varint(zigzag(value), out)
+        elif kind is float:
+            out.append(TAG_FLOAT)
+            out += DOUBLE.pack(value)
+        elif kind is str:
+            out.append(TAG_STR)
+            self._write_bytes(value.encode("utf-8"), out)
+        elif kind is bytes:
+            out.append(TAG_BYTES)
+            self._write_bytes(value, out)
+        else:
+            out.append(TAG_JSON)
+            self._write_bytes(value, out)
+
+    @staticmethod
+    def _write_bytes(value: bytes, out: bytearray):
+        write_varint(len(value), out)
+        out += value
+
+
+class DeltaDecoder:
+    """
+    Rebuilds packets from the frames of one stream.
+    Frames must arrive in order: after a gap (or a duplicate) every delta frame is refused
+    until the next keyframe, since applying it to the wrong reference would corrupt the data.
+    """
+
+    def __init__(self):
+        self.state = StreamState()
+        self.synced = False
+        self.refused = 0  # Frames dropped while out of sync
+        self.keyframe_requested = False  # Set once a keyframe has been asked for in the current gap
+
+    def decode(self, frame: bytes):
+        """
+        Returns the packet carried by a frame, or None if the stream is out of sync
+        and the sender should be asked for a keyframe.
+        """
+        state = self.state
+        flags, sequence = frame[0], frame[1]
+        if flags & FLAG_KEYFRAME:
+            state.reset()
+            self.synced = True
+            self.keyframe_requested = False
+        elif not self.synced or sequence != state.sequence:
+            self.synced = False
+            self.refused += 1
+            return None
+        state.sequence = (sequence + 1) & 0xFF
+
+        offset = 2
+        if flags & FLAG_VERSION:
+            version, offset = self._read_bytes(frame, offset)
+            state.protocol_version = version.decode("utf-8")
+        delta, offset = read_varint(frame, offset)
+        state.packet_id += unzigzag(delta)
+        delta, offset = read_varint(frame, offset)
+        state.timestamp_ms += unzigzag(delta)
+        error_code = None
+        if flags & FLAG_ERROR:
+            error_code, offset = read_varint(frame, offset)
+
+        self._decode_fields(frame, offset)
+        timestamp_ms = state.timestamp_ms
+        return {
+            "packet_id": state.packet_id,
+            # Whole-second timestamps (as produced by create_packet) come back as ints
+            "timestamp": timestamp_ms // 1000 if timestamp_ms % 1000 == 0 else timestamp_ms / 1000,
+            "protocol_version": state.protocol_version,
+            "data": {key: json.loads(value) if type(value) is _Json else value
+                     for key, value in state.reference.items()},
+            "error_code": error_code,
+        }
+
+    def _decode_fields(self, frame: bytes, offset: int):
+        state = self.state
+        reference = state.reference
+        count, offset = read_varint(frame, offset)
+        for _ in range(count):
+            index, offset = read_varint(frame, offset)
+            if index == len(state.keys):
+                name, offset = self._read_bytes(frame, offset)
+                state.keys.append(name.decode("utf-8"))
+            key = state.keys[index]
+            tag = frame[offset]
+            offset += 1
+            if tag == TAG_INT:
+                value, offset = read_varint(frame, offset)
+                reference[key] = unzigzag(value)
+            elif tag == TAG_INT_DELTA:
+                value, offset = read_varint(frame, offset)
+                reference[key] += unzigzag(value)
+            elif tag == TAG_FLOAT:
+                (reference[key],) = DOUBLE.unpack_from(frame, offset)
+                offset += DOUBLE.size
+            elif tag == TAG_STR:
+                value, offset = self._read_bytes(frame, offset)
+                reference[key] = value.decode("utf-8")
+            elif tag == TAG_BYTES:
+                reference[key], offset = self._read_bytes(frame, offset)
+            elif tag == TAG_JSON:
+                value, offset = self._read_bytes(frame, offset)
+                reference[key] = _Json(value)
+            elif tag == TAG_DELETE:
+                reference.pop(key, None)
+            else:
+                raise ValueError(f"Unknown delta field tag {tag}")
+
+    @staticmethod
+    def _read_bytes(frame: bytes, offset: int) -> tuple:
+        length, offset = read_varint(frame, offset)
+        return bytes(frame[offset:offset + length]), offset + length
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, delta_encoding: bool = False, keyframe_interval: int = 32):
+        # ... existing code ...
+        self.delta_encoding = delta_encoding
+        self.keyframe_interval = keyframe_interval
+        self.delta_encoders = {}  # destination -> DeltaEncoder
+        self.delta_decoders = {}  # sender -> DeltaDecoder
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination; with delta encoding on, only what changed since
+        the previous packet to that destination is encrypted and transmitted.
+        """
+        # ... existing code ...
+
+        if self.delta_encoding:
+            encoder = self.delta_encoders.get(destination)
+            if encoder is None:
+                encoder = self.delta_encoders[destination] = DeltaEncoder(self.keyframe_interval)
+            self.transmit(self.cipher_suite.encrypt(encoder.encode(packet)), destination)
+            return
+
+        # ... existing code ...
+
+    def receive_delta_frame(self, frame: bytes, sender: str):
+        """
+        Decrypts and decodes a delta frame. Asks the sender for a keyframe when the stream is
+        out of sync, and answers the sender's own keyframe requests.
+        """
+        body = self.cipher_suite.decrypt(frame)
+        if body[0] & FLAG_KEYFRAME_REQUEST:
+            encoder = self.delta_encoders.get(sender)
+            if encoder is not None:
+                encoder.request_keyframe()
+            return None
+
+        decoder = self.delta_decoders.get(sender)
+        if decoder is None:
+            decoder = self.delta_decoders[sender] = DeltaDecoder()
+        packet = decoder.decode(body)
+        if packet is None:
+            # One request per gap; if it is lost, the next periodic keyframe resyncs the stream
+            if not decoder.keyframe_requested:
+                decoder.keyframe_requested = True
+                print(f"Delta stream from {sender} is out of sync, requesting a keyframe")
+                self.transmit(self.cipher_suite.encrypt(KEYFRAME_REQUEST), sender)
+            return None
+        return self.receive_packet(packet, sender=sender)
+
+
+def run(count: int = 10000, loss_rate: float = 0.01):
+    """
+    Sends a simulated telemetry stream through the codec, comparing bytes on the wire with
+    JSON and counting the packets that could not be decoded because of loss.
+    """
+    encoder = DeltaEncoder()
+    decoder = DeltaDecoder()
+    data = {"type": "telemetry", "sensor": 42, "unit": "celsius", "temperature": 21.5,
+            "humidity": 40, "uptime": 100000, "status": "ok", "tags": ["roof", "north"]}
+    json_bytes = delta_bytes = decoded = 0
+    timestamp = int(time.time())
+    pending_request = False
+
+    start = time.perf_counter()
+    for packet_id in range(1, count + 1):
+        timestamp += random.random() < 0.5
+        data["uptime"] += 1
+        if random.random() < 0.3:
+            data["temperature"] = round(data["temperature"] + random.uniform(-0.5, 0.5), 1)
+        if random.random() < 0.1:
+            data["humidity"] += random.choice((-1, 1))
+        packet = {"packet_id": packet_id, "timestamp": timestamp, "protocol_version": "1.0",
+                  "data": data, "error_code": None}
+        if pending_request:
+            encoder.request_keyframe()
+            pending_request = False
+
+        frame = encoder.encode(packet)
+        json_bytes += len(json.dumps(packet).encode("utf-8"))
+        delta_bytes += len(frame)
+        if random.random() < loss_rate:
+            continue
+        result = decoder.decode(frame)
+        if result is None:
+            pending_request = True  # Delivered with the next frame, as a real request would be
+            continue
+        if result != packet:
+            raise AssertionError(f"Packet {packet_id} decoded incorrectly: {result}")
+        decoded += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"json:  {json_bytes / count:6.1f} bytes/packet")
+    print(f"delta: {delta_bytes / count:6.1f} bytes/packet ({json_bytes / delta_bytes:.1f}x smaller), "
+          f"{elapsed / count * 1e6:.1f} us per encode+decode")
+    print(f"{decoded}/{count} decoded, {decoder.refused} refused while resyncing after {loss_rate:.0%} loss")
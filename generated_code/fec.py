@@ -0,0 +1,160 @@
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+# group ID, index within the group, group size, parity flag, payload length
+# (for a parity frame the length field holds the XOR of the data lengths)
+FEC_HEADER = struct.Struct("!IBBBH")
+DATA = 0
+PARITY = 1
+
+
+def xor_frames(frames: list, length: int) -> np.ndarray:
+    """
+    XORs byte strings together, zero-padding each to length, using one vectorized reduction.
+    """
+    matrix = np.zeros((len(frames), length), dtype=np.uint8)
+    for row, frame in enumerate(frames):
+        matrix[row, :len(frame)] = np.frombuffer(frame, dtype=np.uint8)
+    return np.bitwise_xor.reduce(matrix, axis=0)
+
+
+class FecEncoder:
+    """
+    Adds one XOR parity frame after every group_size data frames, so any single
+    loss inside a group can be rebuilt by the receiver without a retransmission.
+    The redundancy ratio is 1/group_size; adapt() retunes it from the observed loss rate.
+    """
+
+    MIN_GROUP = 2
+    MAX_GROUP = 32
+
+    def __init__(self, group_size: int = 8):
+        self.group_size = group_size
+        self.group_id = 0
+        self.pending = []
+
+    def encode(self, payload: bytes) -> list:
+        """
+        Wraps a payload in a data frame and returns the frames to send, including parity when a group completes.
+        """
+        if len(payload) > 0xFFFF:
+            raise ValueError("FEC payloads are limited to 65535 bytes; fragment larger frames first")
+        frames = [FEC_HEADER.pack(self.group_id, len(self.pending), self.group_size, DATA, len(payload)) + payload]
+        self.pending.append(payload)
+        if len(self.pending) >= self.group_size:
+            frames.append(self.flush())
+        return frames
+
+    def flush(self):
+        """
+        Emits the parity frame for a partially filled group, e.g. before going idle.
+        """
+        if not self.pending:
+            return None
+        length = max(len(payload) for payload in self.pending)
+        length_xor = 0
+        for payload in self.pending:
+            length_xor ^= len(payload)
+        parity = FEC_HEADER.pack(self.group_id, len(self.pending), len(self.pending), PARITY, length_xor)
+        parity += xor_frames(self.pending, length).tobytes()
+        self.group_id = (self.group_id + 1) & 0xFFFFFFFF
+        self.pending = []
+        return parity
+
+    def adapt(self, loss_rate: float):
+        """
+        Picks a group size so that on average well under one packet per group is lost,
+        which keeps single-parity recovery effective.
+        """
+        if loss_rate <= 0:
+            group_size = self.MAX_GROUP
+        else:
+            group_size = int(1 / (4 * loss_rate))
+        self.group_size = max(self.MIN_GROUP, min(self.MAX_GROUP, group_size))
+
+
+class FecDecoder:
+    """
+    Passes data frames straight through and rebuilds a single missing frame per group
+    once the parity and all other data frames of that group have arrived.
+    """
+
+    def __init__(self, max_groups: int = 256):
+        self.max_groups = max_groups
+        self.groups = OrderedDict()  # group_id -> [data {index: payload}, parity frame or None, recovered flag]
+        self.recovered = 0
+
+    def decode(self, frame: bytes) -> list:
+        """
+        Accepts a frame and returns the payloads that became available (received or rebuilt).
+        """
+        group_id, index, group_size, kind, length = FEC_HEADER.unpack_from(frame)
+        body = frame[FEC_HEADER.size:]
+        group = self.groups.get(group_id)
+        if group is None:
+            group = self.groups[group_id] = [{}, None, False]
+            if len(self.groups) > self.max_groups:
+                self.groups.popitem(last=False)
+
+        delivered = []
+        if kind == DATA:
+            if index in group[0] or group[2]:
+                return []  # Duplicate, or already rebuilt from parity
+            group[0][index] = body
+            delivered.append(body)
+        else:
+            group[1] = (group_size, length, body)
+
+        rebuilt = self._recover(group)
+        if rebuilt is not None:
+            delivered.append(rebuilt)
+        return delivered
+
+    def _recover(self, group: list):
+        data, parity, done = group
+        if parity is None or done:
+            return None
+        group_size, length_xor, parity_body = parity
+        if len(data) != group_size - 1:
+            return None
+
+        missing = next(i for i in range(group_size) if i not in data)
+        for payload in data.values():
+            length_xor ^= len(payload)
+        rebuilt = xor_frames([parity_body] + list(data.values()), len(parity_body))[:length_xor].tobytes()
+        data[missing] = rebuilt
+        group[2] = True
+        self.recovered += 1
+        return rebuilt
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, fec_group_size: int = None):
+        # ... existing code ...
+        # FEC is off unless a group size is given
+        self.fec_encoder = FecEncoder(fec_group_size) if fec_group_size else None
+        self.fec_decoder = FecDecoder()
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination, adding parity frames when FEC is enabled.
+        """
+        # ... existing code ...
+
+        frame = self.encrypt_data(packet)
+        if self.fec_encoder is None:
+            self.transmit(frame, destination)
+        else:
+            self.transmit_batch(self.fec_encoder.encode(frame), destination)
+
+        # ... existing code ...
+
+    def receive_fec_frame(self, frame: bytes) -> list:
+        """
+        Decodes an FEC frame and returns the packets it made available, including rebuilt ones.
+        """
+        return [self.receive_packet(self.decrypt_data(payload)) for payload in self.fec_decoder.decode(frame)]
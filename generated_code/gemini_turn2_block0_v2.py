@@ -1,9 +1,9 @@
+import base64
+import binascii
 import time
-import uuid
 from enum import Enum
-from cryptography.fernet import Fernet
-import json
-import hashlib
+
+# cryptography is imported on first use of the cipher, so importing this module stays cheap
 
 class ErrorCode(Enum):
     CONNECTION_REFUSED = 100
@@ -25,11 +25,27 @@ class AdvancedCommunicationProtocol:
 
     def __init__(self, encryption_key: str = None, protocol_version: str = "1.0"):
         # ... existing code ...
-        # Create Fernet object for encryption and decryption
         self.encryption_key = encryption_key
         if not self.encryption_key:
             raise ValueError("Encryption key must be provided.")
-        self.cipher_suite = Fernet(self.encryption_key)
+        # Same check Fernet makes, done here so a bad key still fails at construction
+        try:
+            key_bytes = base64.urlsafe_b64decode(self.encryption_key)
+        except (binascii.Error, TypeError, ValueError):
+            key_bytes = b""
+        if len(key_bytes) != 32:
+            raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+        self._cipher_suite = None  # Created on first encrypt/decrypt
+
+    @property
+    def cipher_suite(self):
+        """
+        Fernet object for encryption and decryption, created the first time it is needed.
+        """
+        if self._cipher_suite is None:
+            from cryptography.fernet import Fernet
+            self._cipher_suite = Fernet(self.encryption_key)
+        return self._cipher_suite
 
     def create_packet(self, data: dict) -> dict:
         """
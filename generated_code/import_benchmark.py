@@ -0,0 +1,58 @@
+import os
+import statistics
+import subprocess
+import sys
+
+MODULE = "gemini_turn2_block0_v2"  # Protocol module whose import cost is guarded
+HEAVY_MODULES = ("cryptography", "json", "hashlib", "uuid")  # Must not be loaded by a plain import
+BUDGET_MS = 15.0  # Median self-import time allowed before the check fails
+RUNS = 20
+
+
+def measure_import(module: str) -> tuple:
+    """
+    Imports the module in a fresh interpreter with -X importtime.
+    Returns the module's cumulative import time in milliseconds and the heavy modules it pulled in.
+    """
+    code = (
+        f"import sys; import {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    # importtime lines look like "import time:   self [us] | cumulative | imported package"
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return cumulative_us / 1000, loaded
+
+
+def run() -> int:
+    timings = []
+    loaded = []
+    for _ in range(RUNS):
+        elapsed_ms, loaded = measure_import(MODULE)
+        timings.append(elapsed_ms)
+
+    median = statistics.median(timings)
+    print(f"import {MODULE}: median {median:.2f} ms, min {min(timings):.2f} ms over {RUNS} runs")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing {MODULE} eagerly loaded {', '.join(loaded)}")
+        failed = True
+    if median > BUDGET_MS:
+        print(f"FAIL: median import time {median:.2f} ms exceeds budget of {BUDGET_MS} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
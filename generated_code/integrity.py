@@ -0,0 +1,159 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+
+SUPPORTED_ALGORITHMS = ("blake2b", "blake2s", "hmac-sha256")
+
+
+class IntegrityEngine:
+    """
+    Keyed integrity tags for packets: BLAKE2b/BLAKE2s in keyed mode or HMAC-SHA256,
+    truncated to tag_size raw bytes instead of a hex string.
+    """
+
+    def __init__(self, key: bytes, algorithm: str = "blake2b", tag_size: int = 16):
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Unsupported integrity algorithm: {algorithm}")
+        max_key = {"blake2b": 64, "blake2s": 32}.get(algorithm)
+        if max_key is not None and len(key) > max_key:
+            raise ValueError(f"{algorithm} keys are limited to {max_key} bytes.")
+        max_tag = {"blake2b": 64, "blake2s": 32, "hmac-sha256": 32}[algorithm]
+        if not 8 <= tag_size <= max_tag:
+            raise ValueError(f"Tag size for {algorithm} must be between 8 and {max_tag} bytes.")
+
+        self.key = key
+        self.algorithm = algorithm
+        self.tag_size = tag_size
+
+    def new(self):
+        """
+        Returns an incremental hasher; call update() for each chunk and tag() at the end.
+        """
+        return IncrementalTag(self)
+
+    def compute_tag(self, data: bytes) -> bytes:
+        """
+        Computes the truncated binary tag of data in one call.
+        """
+        hasher = self.new()
+        hasher.update(data)
+        return hasher.tag()
+
+    def verify(self, data: bytes, tag: bytes) -> bool:
+        """
+        Checks a tag in constant time.
+        """
+        return hmac.compare_digest(self.compute_tag(data), tag)
+
+    def _hash_object(self):
+        if self.algorithm == "blake2b":
+            return hashlib.blake2b(key=self.key, digest_size=self.tag_size)
+        if self.algorithm == "blake2s":
+            return hashlib.blake2s(key=self.key, digest_size=self.tag_size)
+        return hmac.new(self.key, digestmod=hashlib.sha256)
+
+
+class IncrementalTag:
+    """
+    Streaming tag computation for payloads that arrive in chunks.
+    """
+
+    def __init__(self, engine: IntegrityEngine):
+        self.engine = engine
+        self.hash = engine._hash_object()
+
+    def update(self, chunk: bytes):
+        """
+        Feeds the next chunk of the payload.
+        """
+        self.hash.update(chunk)
+        return self
+
+    def tag(self) -> bytes:
+        """
+        Returns the truncated binary tag of everything fed so far.
+        """
+        # BLAKE2 digests are already the requested size; HMAC output is truncated
+        return self.hash.digest()[:self.engine.tag_size]
+
+    def verify(self, tag: bytes) -> bool:
+        """
+        Checks a tag against everything fed so far, in constant time.
+        """
+        return hmac.compare_digest(self.tag(), tag)
+
+
+def fastest_algorithm(payload_size: int = 512, iterations: int = 20000, tag_size: int = 16) -> str:
+    """
+    Times every supported algorithm on this CPU and returns the name of the fastest one.
+    """
+    key = os.urandom(32)
+    payload = os.urandom(payload_size)
+    timings = {}
+    for algorithm in SUPPORTED_ALGORITHMS:
+        engine = IntegrityEngine(key, algorithm, tag_size)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            engine.compute_tag(payload)
+        timings[algorithm] = time.perf_counter() - start
+
+    for algorithm, elapsed in sorted(timings.items(), key=lambda item: item[1]):
+        print(f"{algorithm:12} {elapsed / iterations * 1e6:8.2f} us/tag")
+    return min(timings, key=timings.get)
+
+
+def derive_integrity_key(encryption_key) -> bytes:
+    """
+    Derives a separate 32-byte tag key from the shared encryption key, so peers that share
+    one key agree on the other without reusing the same key for two purposes.
+    """
+    if not encryption_key:
+        raise ValueError("An integrity key or an encryption key must be provided.")
+    if isinstance(encryption_key, str):
+        encryption_key = encryption_key.encode("utf-8")
+    return hmac.new(encryption_key, b"packet integrity key", hashlib.sha256).digest()
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, integrity_key: bytes = None, integrity_algorithm: str = "blake2b", tag_size: int = 16):
+        # ... existing code ...
+        if integrity_key is None:
+            # Both peers already share the encryption key, so derive the tag key from it
+            integrity_key = derive_integrity_key(self.encryption_key)
+        # "auto" benchmarks the supported algorithms once and picks the fastest on this CPU
+        if integrity_algorithm == "auto":
+            integrity_algorithm = fastest_algorithm()
+        self.integrity = IntegrityEngine(integrity_key, integrity_algorithm, tag_size)
+
+    def compute_hash(self, packet: dict) -> bytes:
+        """
+        Computes a keyed binary tag of the packet.
+        """
+        # Convert the packet to a string and then bytes
+        packet_bytes = json.dumps(packet, sort_keys=True, default=str).encode('utf-8')
+
+        return self.integrity.compute_tag(packet_bytes)
+
+    def receive_packet(self, packet: dict, retries=0) -> dict:
+        """
+        Receives a packet and verifies its keyed tag in constant time.
+        """
+        # ... existing code ...
+
+        # Verify the tag of the received packet (without the hash field)
+        received_hash = packet.pop('hash', None)
+        packet_bytes = json.dumps(packet, sort_keys=True, default=str).encode('utf-8')
+
+        # If the tags don't match, raise an error
+        if received_hash is None or not self.integrity.verify(packet_bytes, received_hash):
+            raise ValueError(f"Packet {packet.get('packet_id')} failed integrity verification")
+
+        # ... existing code ...
+
+
+def run():
+    print(f"Fastest integrity algorithm on this CPU: {fastest_algorithm()}")
@@ -0,0 +1,410 @@
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+from array import array
+
+from circuit_breaker import ErrorCode
+
+NO_ERROR = -1  # Stored in place of error_code None
+
+# Column name -> array typecode; rows are appended to every column at once
+COLUMNS = {
+    "timestamp": "d",  # Archive time (wall clock), non-decreasing within a segment
+    "packet_id": "q",
+    "error_code": "i",
+    "source": "I",  # Index into the segment's source dictionary
+    "size": "I",
+    "payload_offset": "Q",  # Offset into the payload blob, or 0xFFFFFFFFFFFFFFFF if not stored
+}
+NO_PAYLOAD = 0xFFFFFFFFFFFFFFFF
+SEGMENT_HEADER = struct.Struct("!4sII")  # magic, row count, metadata length
+SEGMENT_MAGIC = b"ACPB"  # Version 2: segments carry their postings lists
+DENSE_READ_FACTOR = 64  # Read a contiguous block of rows when it is at most this many times the matches
+
+
+def intersect(postings: list, low: int, high: int) -> list:
+    """
+    Returns the rows in [low, high) present in every postings list, starting from the shortest.
+    """
+    postings = sorted(postings, key=len)
+    rows = postings[0]
+    # Postings lists are sorted, so the time range can be cut out with bisect as well
+    rows = rows[bisect.bisect_left(rows, low):bisect.bisect_left(rows, high)]
+    for other in postings[1:]:
+        other = set(other)
+        rows = [row for row in rows if row in other]
+    return list(rows)
+
+
+def make_record(timestamp: float, packet_id: int, error_code: int, source: str, size: int, payload: bytes) -> dict:
+    return {
+        "timestamp": timestamp,
+        "packet_id": packet_id,
+        "error_code": None if error_code == NO_ERROR else error_code,
+        "source": source,
+        "size": size,
+        "payload": payload,
+    }
+
+
+class ArchiveSegment:
+    """
+    A block of archived packets stored column by column, with its own indexes.
+    Sources are dictionary-encoded, and postings lists map sources and error codes to row numbers.
+    """
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        self.sources = []
+        self.source_ids = {}  # source -> index in self.sources
+        self.payloads = bytearray()
+        self.by_source = {}  # source index -> array of rows
+        self.by_error = {}  # error code -> array of rows
+        self.by_packet_id = {}  # packet_id -> array of rows
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def append(self, timestamp: float, packet_id: int, error_code: int, source: str, size: int, payload: bytes = None):
+        """
+        Adds one row to every column and the indexes.
+        """
+        row = len(self)
+        source_id = self.source_ids.get(source)
+        if source_id is None:
+            source_id = self.source_ids[source] = len(self.sources)
+            self.sources.append(source)
+
+        if payload is None:
+            payload_offset = NO_PAYLOAD
+        else:
+            payload_offset = len(self.payloads)
+            self.payloads += struct.pack("!I", len(payload)) + payload
+
+        columns = self.columns
+        columns["timestamp"].append(timestamp)
+        columns["packet_id"].append(packet_id)
+        columns["error_code"].append(error_code)
+        columns["source"].append(source_id)
+        columns["size"].append(size)
+        columns["payload_offset"].append(payload_offset)
+        self._index(row, source_id, error_code, packet_id)
+
+    def _index(self, row: int, source_id: int, error_code: int, packet_id: int):
+        rows = self.by_source.get(source_id)
+        if rows is None:
+            rows = self.by_source[source_id] = array("I")
+        rows.append(row)
+        if error_code != NO_ERROR:
+            rows = self.by_error.get(error_code)
+            if rows is None:
+                rows = self.by_error[error_code] = array("I")
+            rows.append(row)
+        rows = self.by_packet_id.get(packet_id)
+        if rows is None:
+            rows = self.by_packet_id[packet_id] = array("I")
+        rows.append(row)
+
+    def query(self, since: float = None, until: float = None, source: str = None,
+              error_code: int = None, packet_id: int = None) -> list:
+        """
+        Returns the matching row numbers, starting from the most selective index.
+        """
+        timestamps = self.columns["timestamp"]
+        low = 0 if since is None else bisect.bisect_left(timestamps, since)
+        high = len(timestamps) if until is None else bisect.bisect_right(timestamps, until)
+        if low >= high:
+            return []
+
+        candidates = []
+        if source is not None:
+            source_id = self.source_ids.get(source)
+            if source_id is None:
+                return []
+            candidates.append(self.by_source[source_id])
+        if error_code is not None:
+            candidates.append(self.by_error.get(error_code, ()))
+        if packet_id is not None:
+            candidates.append(self.by_packet_id.get(packet_id, ()))
+
+        if not candidates:
+            return list(range(low, high))
+        return intersect(candidates, low, high)
+
+    def row(self, row: int) -> dict:
+        """
+        Materializes one row as a dict.
+        """
+        columns = self.columns
+        payload = None
+        offset = columns["payload_offset"][row]
+        if offset != NO_PAYLOAD:
+            (length,) = struct.unpack_from("!I", self.payloads, offset)
+            payload = bytes(self.payloads[offset + 4:offset + 4 + length])
+        return make_record(columns["timestamp"][row], columns["packet_id"][row], columns["error_code"][row],
+                           self.sources[columns["source"][row]], columns["size"][row], payload)
+
+    def write(self, path: str):
+        """
+        Writes the segment as a header, JSON metadata, the raw column arrays, the payloads and
+        the postings lists. The metadata holds the source dictionary, the time range and where
+        each postings list starts, so a reader can fetch a single list without touching the rest.
+        Packet IDs are stored as one array of IDs sorted for bisection, followed by their rows.
+        """
+        postings = bytearray()
+        directory = {"source": {}, "error": {}}
+        for name, index in (("source", self.by_source), ("error", self.by_error)):
+            for key, rows in index.items():
+                directory[name][str(key)] = [len(postings), len(rows)]
+                postings += rows.tobytes()
+        packet_ids = self.columns["packet_id"]
+        order = sorted(range(len(self)), key=packet_ids.__getitem__)  # Stable, so rows stay sorted per ID
+        directory["packet_id"] = [len(postings), len(order)]
+        postings += array("q", (packet_ids[row] for row in order)).tobytes()
+        postings += array("I", order).tobytes()
+
+        timestamps = self.columns["timestamp"]
+        metadata = json.dumps({
+            "sources": self.sources,
+            "first": timestamps[0],
+            "last": timestamps[-1],
+            "payload_bytes": len(self.payloads),
+            "postings": directory,
+        }).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(self), len(metadata)))
+            f.write(metadata)
+            for name in COLUMNS:
+                self.columns[name].tofile(f)
+            f.write(self.payloads)
+            f.write(postings)
+
+
+class SealedSegment:
+    """
+    A segment written to disk. Only its metadata (source dictionary, time range and postings
+    directory) is kept in memory; a query reads the postings lists it filters on, bisects the
+    timestamp column on disk when the time range cuts through the segment, and then reads only
+    the matching rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, self.rows, metadata_length = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+            if magic != SEGMENT_MAGIC:
+                raise ValueError(f"{path} is not a packet archive segment")
+            metadata = json.loads(f.read(metadata_length))
+        self.sources = metadata["sources"]
+        self.source_ids = {source: i for i, source in enumerate(self.sources)}
+        self.first = metadata["first"]
+        self.last = metadata["last"]
+        self.postings = metadata["postings"]
+        offset = SEGMENT_HEADER.size + metadata_length
+        self.column_offsets = {}
+        for name, code in COLUMNS.items():
+            self.column_offsets[name] = offset
+            offset += array(code).itemsize * self.rows
+        self.payload_start = offset
+        self.postings_start = offset + metadata["payload_bytes"]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def query(self, since: float = None, until: float = None, source: str = None,
+              error_code: int = None, packet_id: int = None) -> list:
+        """
+        Returns the matching records.
+        """
+        if (since is not None and self.last < since) or (until is not None and self.first > until):
+            return []
+        with open(self.path, "rb") as f:
+            low = 0 if since is None or since <= self.first else self._bisect(f, since, False)
+            high = self.rows if until is None or until >= self.last else self._bisect(f, until, True)
+            if low >= high:
+                return []
+
+            candidates = []
+            if source is not None:
+                source_id = self.source_ids.get(source)
+                if source_id is None:
+                    return []
+                candidates.append(self._postings(f, *self.postings["source"][str(source_id)]))
+            if error_code is not None:
+                entry = self.postings["error"].get(str(error_code))
+                if entry is None:
+                    return []
+                candidates.append(self._postings(f, *entry))
+            if packet_id is not None:
+                offset, count = self.postings["packet_id"]
+                ids = self._postings(f, offset, count, "q")
+                first = bisect.bisect_left(ids, packet_id)
+                last = bisect.bisect_right(ids, packet_id)
+                if first == last:
+                    return []
+                candidates.append(self._postings(f, offset + count * ids.itemsize + first * 4, last - first))
+
+            rows = intersect(candidates, low, high) if candidates else range(low, high)
+            return self._records(f, rows)
+
+    def _read(self, f, name: str, start: int, count: int) -> array:
+        values = array(COLUMNS[name])
+        f.seek(self.column_offsets[name] + start * values.itemsize)
+        values.fromfile(f, count)
+        return values
+
+    def _postings(self, f, offset: int, count: int, typecode: str = "I") -> array:
+        values = array(typecode)
+        f.seek(self.postings_start + offset)
+        values.fromfile(f, count)
+        return values
+
+    def _bisect(self, f, timestamp: float, right: bool) -> int:
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            value = self._read(f, "timestamp", middle, 1)[0]
+            if value < timestamp or (right and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _records(self, f, rows) -> list:
+        if not rows:
+            return []
+        first, span = rows[0], rows[-1] - rows[0] + 1
+        if span <= DENSE_READ_FACTOR * len(rows):
+            blocks = {name: self._read(f, name, first, span) for name in COLUMNS}
+            values = [[blocks[name][row - first] for name in COLUMNS] for row in rows]
+        else:
+            values = [[self._read(f, name, row, 1)[0] for name in COLUMNS] for row in rows]
+
+        records = []
+        for timestamp, packet_id, error_code, source_id, size, payload_offset in values:
+            payload = None
+            if payload_offset != NO_PAYLOAD:
+                f.seek(self.payload_start + payload_offset)
+                (length,) = struct.unpack("!I", f.read(4))
+                payload = f.read(length)
+            records.append(make_record(timestamp, packet_id, error_code, self.sources[source_id], size, payload))
+        return records
+
+
+class PacketArchive:
+    """
+    Append-only archive of packet metadata (and optionally encrypted payloads) for IDS forensics.
+    The active segment lives in memory; full segments are sealed to disk together with their
+    postings lists. Only the metadata of a sealed segment is kept in memory, so a query skips
+    segments outside the requested window and reads just the postings and rows it needs from the others.
+    Receive and intrusion-analysis threads append concurrently, so appends, sealing and reads of the
+    active segment take a lock; sealed segments are immutable and are queried outside it.
+    """
+
+    def __init__(self, directory: str, segment_rows: int = 100000, store_payloads: bool = False):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.store_payloads = store_payloads
+        os.makedirs(directory, exist_ok=True)
+        self.sealed = []  # SealedSegment, oldest first
+        self.segment_count = 0
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".seg"):
+                self.segment_count += 1
+                self.sealed.append(SealedSegment(os.path.join(directory, name)))
+        self.active = ArchiveSegment()
+        self.lock = threading.Lock()
+
+    def append(self, packet: dict, source: str, error_code: int = None, payload: bytes = None):
+        """
+        Archives one packet's metadata, plus its encrypted payload when payload storage is enabled.
+        """
+        if error_code is None:
+            error_code = packet.get("error_code")
+        data = packet.get("data")
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self.lock:
+            self.active.append(
+                time.time(),
+                packet.get("packet_id") or 0,
+                NO_ERROR if error_code is None else error_code,
+                source or "",
+                len(data) if isinstance(data, (bytes, str)) else 0,
+                payload if self.store_payloads else None,
+            )
+            if len(self.active) >= self.segment_rows:
+                self._seal()
+
+    def seal(self):
+        """
+        Writes the active segment to disk and starts a new one.
+        """
+        with self.lock:
+            self._seal()
+
+    def _seal(self):
+        if not len(self.active):
+            return
+        path = os.path.join(self.directory, f"segment_{self.segment_count:08d}.seg")
+        self.segment_count += 1
+        self.active.write(path)
+        self.sealed.append(SealedSegment(path))
+        self.active = ArchiveSegment()
+
+    def close(self):
+        """
+        Seals the rows still in memory so they survive the process; call before exiting.
+        """
+        self.seal()
+
+    def query(self, since: float = None, until: float = None, source: str = None,
+              error_code: int = None, packet_id: int = None) -> list:
+        """
+        Returns the archived records matching every given filter, e.g.
+        query(source="10.0.0.5", error_code=105, since=time.time() - 3600).
+        """
+        with self.lock:
+            sealed = list(self.sealed)
+            active = self.active
+            recent = [active.row(row) for row in active.query(since, until, source, error_code, packet_id)]
+        results = []
+        for segment in sealed:
+            results.extend(segment.query(since, until, source, error_code, packet_id))
+        return results + recent
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, archive_directory: str = None, archive_payloads: bool = False):
+        # ... existing code ...
+        # Archiving is opt-in: nothing is written unless a directory is given
+        self.archive = PacketArchive(archive_directory, store_payloads=archive_payloads) if archive_directory else None
+
+    def close_archive(self):
+        """
+        Flushes archived rows still in memory to disk.
+        """
+        if self.archive is not None:
+            self.archive.close()
+
+    def receive_packet(self, packet: dict, sender: str = None, retries=0) -> dict:
+        """
+        Receives a packet, archiving its metadata before the payload is decrypted.
+        """
+        if self.archive is not None:
+            self.archive.append(packet, sender, payload=packet.get('data'))
+
+        # ... existing code ...
+
+    def log_intrusion_attempt(self, packet: dict, sender: str = None):
+        """
+        Records a flagged packet in the archive so it can be found by forensic queries later.
+        """
+        print(f"Intrusion detected from {sender}! Archiving packet {packet.get('packet_id')}...")
+        if self.archive is not None:
+            self.archive.append(packet, sender, error_code=ErrorCode.UNAUTHORIZED_ACCESS.value, payload=packet.get('data'))
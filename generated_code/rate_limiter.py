@@ -0,0 +1,142 @@
+import threading
+import time
+
+
+class TokenBucketTable:
+    """
+    Token buckets for many keys (destinations) sharing one rate and burst size.
+    Buckets are refilled lazily when they are touched, so there is no timer per bucket.
+    A key with no entry is treated as a full bucket, which lets idle buckets be dropped for free.
+    The table is guarded by one lock, so it can be shared between sending threads.
+    """
+
+    def __init__(self, rate: float, burst: float, sweep_threshold: int = 100000):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst  # Bucket capacity
+        self.sweep_threshold = sweep_threshold  # Table size that triggers dropping full buckets
+        self.next_sweep = sweep_threshold
+        self.buckets = {}  # key -> [tokens, last refill time]
+        self.lock = threading.Lock()
+
+    def try_acquire(self, key, tokens: float = 1.0, now: float = None) -> float:
+        """
+        Takes tokens from the key's bucket.
+        Returns 0.0 on success, otherwise the number of seconds until enough tokens are available.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                available = self.burst
+            else:
+                available = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+            if available < tokens:
+                return (tokens - available) / self.rate
+
+            if bucket is None:
+                if len(self.buckets) >= self.next_sweep:
+                    self._sweep(now)
+                self.buckets[key] = [available - tokens, now]
+            else:
+                bucket[0] = available - tokens
+                bucket[1] = now
+            return 0.0
+
+    def release(self, key, tokens: float = 1.0):
+        """
+        Returns tokens taken by try_acquire that were not used.
+        """
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:  # A swept bucket is already full
+                bucket[0] = min(self.burst, bucket[0] + tokens)
+
+    def sweep(self, now: float = None):
+        """
+        Drops every bucket that has refilled completely, since a missing bucket means a full one.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.rate < self.burst
+        }
+        # If most buckets are still active, wait for the table to grow before sweeping again
+        self.next_sweep = max(self.sweep_threshold, 2 * len(self.buckets))
+
+
+class Pacer:
+    """
+    Spreads sends evenly in time instead of letting them go out in bursts.
+    Each send reserves the next slot at least 1/rate seconds after the previous one.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def delay(self, now: float = None) -> float:
+        """
+        Reserves the next send slot and returns how long to wait before using it.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        return slot - now
+
+    def wait(self):
+        """
+        Blocks until the next send slot.
+        """
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, destination_rate: float = 1000.0, destination_burst: float = 100.0,
+                 global_rate: float = 100000.0, global_burst: float = 10000.0, pacing_rate: float = None):
+        # ... existing code ...
+        self.destination_limiter = TokenBucketTable(destination_rate, destination_burst)
+        self.global_limiter = TokenBucketTable(global_rate, global_burst)
+        self.pacer = Pacer(pacing_rate) if pacing_rate else None
+
+    def acquire_send_slot(self, destination: str, block: bool = True) -> bool:
+        """
+        Waits until both the destination and the global limiter allow one more packet.
+        Returns False instead of waiting when block is False and the send would exceed a limit.
+        """
+        while True:
+            wait = self.destination_limiter.try_acquire(destination)
+            if wait == 0.0:
+                wait = self.global_limiter.try_acquire(None)
+                if wait == 0.0:
+                    break
+                # Give the destination token back, the packet is not going out yet
+                self.destination_limiter.release(destination)
+            if not block:
+                return False
+            time.sleep(wait)
+
+        if self.pacer is not None:
+            self.pacer.wait()
+        return True
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination once the rate limiters and the pacer allow it.
+        """
+        self.acquire_send_slot(destination)
+
+        # ... existing code ...
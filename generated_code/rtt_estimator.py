@@ -0,0 +1,121 @@
+import threading
+import time
+from array import array
+
+
+class RttTable:
+    """
+    Per-destination smoothed RTT and RTT variance (Jacobson/Karels) with Karn's rule.
+    State lives in parallel arrays indexed by a slot number per destination, so each
+    tracked destination costs a few dozen bytes instead of a Python object.
+    """
+
+    ALPHA = 1 / 8  # Gain for the smoothed RTT
+    BETA = 1 / 4  # Gain for the RTT variance
+    K = 4  # Variance multiplier in the timeout
+    CLOCK_GRANULARITY = 0.001  # Seconds
+
+    def __init__(self, initial_rto: float = 1.0, min_rto: float = 0.005, max_rto: float = 60.0):
+        self.initial_rto = initial_rto  # Used until a destination has its first RTT sample
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.slots = {}  # destination -> index into the arrays below
+        self.srtt = array("d")
+        self.rttvar = array("d")
+        self.rto = array("d")
+        self.backoff = array("B")  # Number of consecutive timeouts, for exponential backoff
+        self.lock = threading.Lock()  # Only taken to allocate a new slot
+
+    def slot(self, destination: str) -> int:
+        """
+        Returns the array index for a destination, allocating one on first use.
+        """
+        index = self.slots.get(destination)
+        if index is None:
+            with self.lock:
+                index = self.slots.get(destination)
+                if index is None:
+                    self.srtt.append(0.0)
+                    self.rttvar.append(0.0)
+                    self.rto.append(self.initial_rto)
+                    self.backoff.append(0)
+                    index = self.slots[destination] = len(self.srtt) - 1
+        return index
+
+    def sample(self, destination: str, rtt: float):
+        """
+        Feeds one RTT measurement. Per Karn's rule, callers must not pass samples
+        from packets that were retransmitted, since it is unknown which copy was acknowledged.
+        """
+        i = self.slot(destination)
+        if self.srtt[i] == 0.0:
+            self.srtt[i] = rtt
+            self.rttvar[i] = rtt / 2
+        else:
+            self.rttvar[i] = (1 - self.BETA) * self.rttvar[i] + self.BETA * abs(self.srtt[i] - rtt)
+            self.srtt[i] = (1 - self.ALPHA) * self.srtt[i] + self.ALPHA * rtt
+        rto = self.srtt[i] + max(self.CLOCK_GRANULARITY, self.K * self.rttvar[i])
+        self.rto[i] = min(self.max_rto, max(self.min_rto, rto))
+        self.backoff[i] = 0  # A valid sample ends the backoff
+
+    def timeout(self, destination: str) -> float:
+        """
+        Returns the current retransmission timeout for a destination, including any backoff.
+        """
+        i = self.slot(destination)
+        return min(self.max_rto, self.rto[i] * (2 ** self.backoff[i]))
+
+    def on_timeout(self, destination: str):
+        """
+        Doubles the timeout after a retransmission; it stays doubled until a clean sample arrives.
+        """
+        i = self.slot(destination)
+        if self.backoff[i] < 16:
+            self.backoff[i] += 1
+
+
+class AdvancedCommunicationProtocol:
+    MAX_RETRIES = 3  # Maximum number of retries
+    MAX_RTT_IN_FLIGHT = 65536  # Unacknowledged packets timed at once; the oldest are forgotten beyond this
+
+    # ... existing code ...
+
+    def __init__(self):
+        # ... existing code ...
+        self.rtt = RttTable()
+        self.rtt_in_flight = {}  # packet_id -> (destination, send time, retransmitted), oldest first
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination, retrying up to MAX_RETRIES times after the destination's adaptive timeout.
+        A packet sent again before its acknowledgement arrived counts as retransmitted, whichever path resent it.
+        """
+        packet_id = packet["packet_id"]
+        retransmitted = retries > 0 or packet_id in self.rtt_in_flight
+        self.rtt_in_flight[packet_id] = (destination, time.monotonic(), retransmitted)
+        if len(self.rtt_in_flight) > self.MAX_RTT_IN_FLIGHT:
+            self.rtt_in_flight.pop(next(iter(self.rtt_in_flight)), None)
+
+        # ... existing code ...
+
+        # If an error occurs and we haven't reached the maximum number of retries, retry sending the packet
+        if packet.get("error_code") is not None and retries < self.MAX_RETRIES:
+            delay = self.rtt.timeout(destination)
+            self.rtt.on_timeout(destination)
+            print(f"Error occurred while sending packet, retrying in {delay:.3f} seconds ({retries + 1}/{self.MAX_RETRIES})...")
+            time.sleep(delay)  # Wait before retrying
+            self.send_packet(packet, destination, retries + 1)
+        elif packet.get("error_code") is not None:
+            self.rtt_in_flight.pop(packet_id, None)  # Retries exhausted; no acknowledgement will come
+
+    def record_ack(self, packet_id: int):
+        """
+        Records the round trip of an acknowledged packet, skipping retransmitted ones (Karn's rule).
+        Called by handle_ack for every packet a SACK acknowledges.
+        """
+        entry = self.rtt_in_flight.pop(packet_id, None)
+        if entry is None:
+            return
+        destination, sent_at, retransmitted = entry
+        if not retransmitted:
+            self.rtt.sample(destination, time.monotonic() - sent_at)
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+
+class Priority(Enum):
+    CONTROL = 0  # Acknowledgements, error reports and other control traffic
+    INTERACTIVE = 1
+    BULK = 2
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a priority class has reached its queue-depth limit.
+    """
+
+
+class DeficitRoundRobinScheduler:
+    """
+    Deficit round-robin scheduler across priority classes.
+    Each class gets a byte quantum per round, so bulk traffic cannot delay control traffic
+    for more than one bulk quantum, while lower classes are never starved completely.
+    Sending threads may enqueue while another thread dequeues.
+    """
+
+    DEFAULT_QUANTUMS = {Priority.CONTROL: 8192, Priority.INTERACTIVE: 4096, Priority.BULK: 1500}
+    DEFAULT_LIMITS = {Priority.CONTROL: 1024, Priority.INTERACTIVE: 4096, Priority.BULK: 16384}
+
+    def __init__(self, quantums: dict = None, limits: dict = None, max_wait: float = 0.5):
+        self.quantums = dict(quantums or self.DEFAULT_QUANTUMS)
+        self.limits = dict(limits or self.DEFAULT_LIMITS)
+        self.max_wait = max_wait  # Seconds a queued item may wait before it is served out of turn
+        self.queues = {priority: deque() for priority in Priority}
+        self.deficits = {priority: 0 for priority in Priority}
+        self.dropped = {priority: 0 for priority in Priority}
+        self.order = list(Priority)
+        self.current = 0
+        self.credited = False
+        self.aged_served = False  # True once an aged item was served out of turn in this round
+        self.lock = threading.Lock()
+
+    def enqueue(self, item, priority: Priority, size: int):
+        """
+        Queues an item of the given size in bytes, raising QueueFullError if its class is full.
+        """
+        with self.lock:
+            queue = self.queues[priority]
+            if len(queue) >= self.limits[priority]:
+                self.dropped[priority] += 1
+                raise QueueFullError(f"Send queue for {priority.name} is full ({len(queue)} items)")
+            queue.append((time.monotonic(), size, item))
+
+    def dequeue(self):
+        """
+        Returns the next item to send, or None if every queue is empty.
+        """
+        with self.lock:
+            return self._dequeue()
+
+    def _dequeue(self):
+        if not any(self.queues.values()):
+            return None
+
+        # Starvation protection: at most one item per round that has waited too long goes out of turn,
+        # highest class first, so a permanently backlogged bulk queue cannot take over the link
+        if not self.aged_served:
+            now = time.monotonic()
+            for priority in self.order:
+                queue = self.queues[priority]
+                if queue and now - queue[0][0] > self.max_wait:
+                    self.aged_served = True
+                    return queue.popleft()[2]
+
+        while True:
+            priority = self.order[self.current]
+            queue = self.queues[priority]
+            if not queue:
+                # An idle class does not bank credit for later
+                self.deficits[priority] = 0
+                self._next_class()
+                continue
+
+            # A class earns its quantum once per visit and spends it until the next item no longer fits
+            if not self.credited:
+                self.deficits[priority] += self.quantums[priority]
+                self.credited = True
+            size = queue[0][1]
+            if self.deficits[priority] < size:
+                self._next_class()
+                continue
+
+            self.deficits[priority] -= size
+            return queue.popleft()[2]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def _next_class(self):
+        self.current = (self.current + 1) % len(self.order)
+        self.credited = False
+        if self.current == 0:
+            self.aged_served = False  # A new round starts
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self):
+        # ... existing code ...
+        self.scheduler = DeficitRoundRobinScheduler()
+        # A sender thread drains the scheduler; send_packet only queues and wakes it. While the
+        # thread is busy transmitting, new packets pile up and the scheduler picks their order.
+        self.send_wakeup = threading.Event()
+        self.sender_stop = threading.Event()
+        self.sender_thread = threading.Thread(target=self._send_queued, daemon=True)
+        self.sender_thread.start()
+
+    def close(self):
+        """
+        Stops the sender thread once it has sent everything already queued.
+        """
+        # ... existing code ...
+        self.sender_stop.set()
+        self.send_wakeup.set()
+        if self.sender_thread is not threading.current_thread():
+            self.sender_thread.join()
+
+    def packet_priority(self, packet: dict) -> Priority:
+        """
+        Reads the priority class from the packet, treating error notifications as control traffic.
+        Missing or unknown priorities are treated as bulk.
+        """
+        if packet.get("error_code") is not None:
+            return Priority.CONTROL
+        priority = packet.get("priority")
+        try:
+            return Priority[priority.upper()] if isinstance(priority, str) else Priority(priority)
+        except (KeyError, ValueError):
+            return Priority.BULK
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Queues a packet for sending according to its priority class and wakes the sender thread,
+        which transmits it; the packet may not have left yet when this returns.
+        """
+        # ... existing code ...
+
+        frame = self.encrypt_data(packet['data'])
+        try:
+            self.scheduler.enqueue((frame, destination), self.packet_priority(packet), len(frame))
+        except QueueFullError as e:
+            print(f"Dropping packet {packet['packet_id']}: {e}")
+            return
+        self.send_wakeup.set()
+
+        # ... existing code ...
+
+    def flush(self, max_items: int = None):
+        """
+        Sends queued frames in scheduler order until the queues are empty or max_items were sent.
+        Called by the sender thread; can also be called directly to send synchronously.
+        """
+        sent = 0
+        while max_items is None or sent < max_items:
+            item = self.scheduler.dequeue()
+            if item is None:
+                break
+            frame, destination = item
+            self.transmit(frame, destination)
+            sent += 1
+        return sent
+
+    def _send_queued(self):
+        while True:
+            self.send_wakeup.wait()
+            # Clear before draining, so a packet queued meanwhile wakes the next pass
+            self.send_wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error sending queued packets: {e}")
+            if self.sender_stop.is_set():
+                return
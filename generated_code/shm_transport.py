@@ -0,0 +1,287 @@
+import os
+import select
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from transports import TRANSPORTS, Transport
+
+# Header layout: producer and consumer indices sit on separate cache lines to avoid false sharing
+HEAD_OFFSET = 0  # Total bytes ever written (u64), only written by the producer
+TAIL_OFFSET = 64  # Total bytes ever read (u64), only written by the consumer
+WAITING_OFFSET = 128  # Set by the consumer before it blocks on the wakeup fd
+CAPACITY_OFFSET = 192
+TRACKER_OFFSET = 200  # PID of the owner's resource tracker (u64), see ShmRing.__init__
+DATA_OFFSET = 256
+
+INDEX = struct.Struct("=Q")
+FLAG = struct.Struct("=I")
+RECORD_LENGTH = struct.Struct("=I")
+WRAP_MARKER = 0xFFFFFFFF  # Record length meaning "the rest of the ring is unused, continue at the start"
+MAX_SLEEP = 0.005  # Longest single sleep on the wakeup fd; bounds the cost of a missed wakeup
+
+# First byte of every protocol frame, so the receiver knows whether the payload was encrypted
+FRAME_PLAINTEXT = b"\x00"
+FRAME_ENCRYPTED = b"\x01"
+
+
+def _tracker_pid() -> int:
+    return getattr(resource_tracker._resource_tracker, "_pid", None) or 0
+
+
+class ShmRing:
+    """
+    Single-producer/single-consumer ring buffer of length-prefixed records in shared memory.
+    Each side only ever writes its own index, so no lock is needed: the producer publishes
+    new records by advancing head after copying them, the consumer frees space by advancing tail.
+    Records never straddle the end of the ring; a wrap marker sends the reader back to the start.
+    """
+
+    def __init__(self, name: str, capacity: int = 16 * 1024 * 1024, create: bool = False, wakeup_fd: int = None):
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=DATA_OFFSET + capacity)
+            self.shm.buf[:DATA_OFFSET] = bytes(DATA_OFFSET)
+            INDEX.pack_into(self.shm.buf, CAPACITY_OFFSET, capacity)
+            INDEX.pack_into(self.shm.buf, TRACKER_OFFSET, _tracker_pid())
+        elif sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Attaching registers the segment with this process's resource tracker, which would
+            # unlink the owner's ring when this process exits. Undo that, unless this process shares
+            # the owner's tracker (a forked child): it tracks names in a set, so the unregister
+            # would drop the owner's own registration.
+            self.shm = shared_memory.SharedMemory(name=name)
+            if _tracker_pid() != INDEX.unpack_from(self.shm.buf, TRACKER_OFFSET)[0]:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.buf = self.shm.buf
+        self.capacity = INDEX.unpack_from(self.buf, CAPACITY_OFFSET)[0]
+        self.owner = create
+        # Optional eventfd shared by both processes (inherited across fork) for blocking waits
+        self.wakeup_fd = wakeup_fd
+
+    def write_many(self, frames: list, timeout: float = None) -> int:
+        """
+        Copies frames into the ring and publishes them with a single head update.
+        Waits for free space when the ring is full; returns the number of frames written.
+        """
+        buf = self.buf
+        capacity = self.capacity
+        head = INDEX.unpack_from(buf, HEAD_OFFSET)[0]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        written = 0
+
+        for frame in frames:
+            size = RECORD_LENGTH.size + len(frame)
+            if size > capacity // 2:
+                raise ValueError(f"Frame of {len(frame)} bytes is too large for a {capacity} byte ring")
+
+            offset = head % capacity
+            skip = capacity - offset if capacity - offset < size else 0
+            while head + skip + size - INDEX.unpack_from(buf, TAIL_OFFSET)[0] > capacity:
+                # Publish what we have so the consumer can make room, then back off
+                INDEX.pack_into(buf, HEAD_OFFSET, head)
+                self._wake()
+                if deadline is not None and time.monotonic() > deadline:
+                    return written
+                time.sleep(0)
+
+            if skip:
+                if skip >= RECORD_LENGTH.size:
+                    RECORD_LENGTH.pack_into(buf, DATA_OFFSET + offset, WRAP_MARKER)
+                head += skip
+                offset = 0
+
+            start = DATA_OFFSET + offset
+            RECORD_LENGTH.pack_into(buf, start, len(frame))
+            buf[start + RECORD_LENGTH.size:start + size] = frame
+            head += size
+            written += 1
+
+        INDEX.pack_into(buf, HEAD_OFFSET, head)
+        self._wake()
+        return written
+
+    def read_many(self, max_frames: int = 1024) -> list:
+        """
+        Returns up to max_frames records without blocking.
+        """
+        buf = self.buf
+        capacity = self.capacity
+        head = INDEX.unpack_from(buf, HEAD_OFFSET)[0]
+        tail = INDEX.unpack_from(buf, TAIL_OFFSET)[0]
+        frames = []
+
+        while tail < head and len(frames) < max_frames:
+            offset = tail % capacity
+            remaining = capacity - offset
+            if remaining < RECORD_LENGTH.size:
+                tail += remaining
+                continue
+            length = RECORD_LENGTH.unpack_from(buf, DATA_OFFSET + offset)[0]
+            if length == WRAP_MARKER:
+                tail += remaining
+                continue
+            start = DATA_OFFSET + offset + RECORD_LENGTH.size
+            frames.append(bytes(buf[start:start + length]))
+            tail += RECORD_LENGTH.size + length
+
+        INDEX.pack_into(buf, TAIL_OFFSET, tail)
+        return frames
+
+    def wait(self, timeout: float = None):
+        """
+        Blocks until the producer publishes more data or the timeout expires.
+        Spins briefly first, then sleeps on the eventfd if there is one, otherwise polls with backoff.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in range(200):
+            if self._has_data():
+                return
+        if self.wakeup_fd is not None:
+            FLAG.pack_into(self.buf, WAITING_OFFSET, 1)
+            try:
+                # Python gives no store-load fence between raising the flag and reading head (nor on
+                # the producer side), so a wakeup can be missed; each sleep is bounded and followed
+                # by a re-check, which limits a missed wakeup to MAX_SLEEP of extra latency.
+                while not self._has_data():
+                    sleep = MAX_SLEEP
+                    if deadline is not None:
+                        sleep = min(sleep, deadline - time.monotonic())
+                        if sleep <= 0:
+                            return
+                    if select.select([self.wakeup_fd], [], [], sleep)[0]:
+                        os.eventfd_read(self.wakeup_fd)
+            finally:
+                FLAG.pack_into(self.buf, WAITING_OFFSET, 0)
+            return
+        delay = 0.00001
+        while not self._has_data():
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 0.001)
+
+    def close(self):
+        """
+        Detaches from the segment; the creating side also removes it.
+        """
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                # Already removed by someone else; still drop it from our resource tracker
+                if sys.version_info < (3, 13):
+                    resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def _has_data(self) -> bool:
+        return INDEX.unpack_from(self.buf, HEAD_OFFSET)[0] != INDEX.unpack_from(self.buf, TAIL_OFFSET)[0]
+
+    def _wake(self):
+        # Only pay for the syscall when the consumer is actually asleep
+        if self.wakeup_fd is not None and FLAG.unpack_from(self.buf, WAITING_OFFSET)[0]:
+            os.eventfd_write(self.wakeup_fd, 1)
+
+
+class SharedMemoryTransport(Transport):
+    """
+    Transport for peers on the same host. The destination is the name of the ring segment
+    created by the receiver's bind(); frames are copied straight into shared memory.
+    Frames are not encrypted by default since the memory never leaves the host.
+    """
+
+    def __init__(self, capacity: int = 16 * 1024 * 1024, encrypted: bool = False, wakeup_fd: int = None):
+        self.capacity = capacity
+        self.encrypted = encrypted
+        self.wakeup_fd = wakeup_fd
+        self.rings = {}  # destination segment name -> ShmRing
+        self.inbound = None
+
+    def send_many(self, frames: list, destination: str):
+        ring = self.rings.get(destination)
+        if ring is None:
+            ring = self.rings[destination] = ShmRing(destination, wakeup_fd=self.wakeup_fd)
+        ring.write_many(frames)
+
+    def bind(self, address: str):
+        self.inbound = ShmRing(address, self.capacity, create=True, wakeup_fd=self.wakeup_fd)
+
+    def receive(self, timeout: float = None) -> list:
+        frames = self.inbound.read_many()
+        if frames:
+            return frames
+        self.inbound.wait(timeout)
+        return self.inbound.read_many()
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings.clear()
+        if self.inbound is not None:
+            self.inbound.close()
+            self.inbound = None
+
+
+TRANSPORTS["shm"] = SharedMemoryTransport
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet through the configured transport, skipping encryption for trusted local transports.
+        The first byte of the frame says which of the two was done.
+        """
+        # ... existing code ...
+
+        if self.transport.encrypted:
+            frame = FRAME_ENCRYPTED + self.encrypt_data(packet)
+        else:
+            frame = FRAME_PLAINTEXT + self.serialize_data(packet)
+        self.transmit(frame, destination)
+
+        # ... existing code ...
+
+    def receive_frame(self, frame: bytes) -> dict:
+        """
+        Decodes a frame from the transport. Plaintext frames are only accepted when this side's
+        transport is itself unencrypted, so they cannot be slipped in over a network transport.
+        """
+        kind, body = frame[:1], frame[1:]
+        if kind == FRAME_ENCRYPTED:
+            return self.receive_packet(self.decrypt_data(body))
+        if kind == FRAME_PLAINTEXT and not self.transport.encrypted:
+            return self.receive_packet(self.deserialize_data(body))
+        raise ValueError("Rejected frame: plaintext frames are not accepted on an encrypted transport")
+
+
+def run(count: int = 2000000, frame_size: int = 64, batch_size: int = 256):
+    """
+    Measures throughput between two processes over a shared-memory ring.
+    """
+    name = f"acp-bench-{os.getpid()}"
+    wakeup_fd = os.eventfd(0, os.EFD_NONBLOCK) if hasattr(os, "eventfd") else None
+    receiver = SharedMemoryTransport(wakeup_fd=wakeup_fd)
+    receiver.bind(name)
+    count = count // batch_size * batch_size
+
+    pid = os.fork()
+    if pid == 0:
+        sender = SharedMemoryTransport(wakeup_fd=wakeup_fd)
+        batch = [os.urandom(frame_size)] * batch_size
+        for _ in range(count // batch_size):
+            sender.send_many(batch, name)
+        sender.close()
+        os._exit(0)
+
+    received = 0
+    start = time.perf_counter()
+    while received < count:
+        received += len(receiver.receive(timeout=1.0))
+    elapsed = time.perf_counter() - start
+    os.waitpid(pid, 0)
+    receiver.close()
+    print(f"shm     {received / elapsed:12,.0f} frames/s  {received * frame_size / elapsed / 1e6:8.1f} MB/s")
@@ -0,0 +1,526 @@
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from async_ids import AdvancedCommunicationProtocol as AsyncIdsProtocol, IntrusionAnalyzer
+from circuit_breaker import AdvancedCommunicationProtocol as BreakerProtocol, ErrorCode
+from dedup_cache import AdvancedCommunicationProtocol as DedupProtocol, DeduplicationCache
+from fragmentation import FragmentReassembler, fragment_frame
+from integrity import IntegrityEngine
+from packet_archive import AdvancedCommunicationProtocol as ArchiveProtocol, PacketArchive
+from rate_limiter import TokenBucketTable
+from rtt_estimator import RttTable
+from selective_ack import AdvancedCommunicationProtocol as SackProtocol
+from send_scheduler import DeficitRoundRobinScheduler, Priority
+from stream_mux import CREDIT_REFRESH, StreamDemultiplexer, StreamMultiplexer
+
+
+class PacketIdAllocator:
+    """
+    Hands out unique packet IDs to many threads.
+    Each thread reserves a block of IDs under a lock and then uses it without synchronization,
+    so the lock is taken once per block_size packets. IDs increase within a thread but threads
+    interleave; use block_size=1 for strictly sequential IDs across the instance.
+    """
+
+    def __init__(self, start: int = 1, block_size: int = 64):
+        self.next_block = start
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def next_id(self) -> int:
+        """
+        Returns an ID no other thread will receive.
+        """
+        local = self.local
+        current = getattr(local, "current", 0)
+        if current >= getattr(local, "end", 0):
+            with self.lock:
+                current = self.next_block
+                self.next_block += self.block_size
+            local.end = current + self.block_size
+        local.current = current + 1
+        return current
+
+
+class ShardedCounter:
+    """
+    Counter that each thread increments in its own cell, so increments never contend
+    (no shared cache line, no lock). value() sums the cells and is exact once writers are idle.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.cells = []  # One [count] list per thread that has ever incremented
+        self.lock = threading.Lock()  # Only guards registration of new cells
+
+    def add(self, amount: int = 1):
+        """
+        Adds amount to the calling thread's cell.
+        """
+        cell = getattr(self.local, "cell", None)
+        if cell is None:
+            cell = self.local.cell = [0]
+            with self.lock:
+                self.cells.append(cell)
+        cell[0] += amount
+
+    def value(self) -> int:
+        """
+        Returns the sum over all threads.
+        """
+        with self.lock:
+            cells = list(self.cells)
+        return sum(cell[0] for cell in cells)
+
+
+class ProtocolStats:
+    """
+    Named sharded counters for the protocol's statistics.
+    """
+
+    NAMES = ("packets_sent", "packets_received", "bytes_sent", "retries", "errors")
+
+    def __init__(self):
+        self.counters = {name: ShardedCounter() for name in self.NAMES}
+
+    def add(self, name: str, amount: int = 1):
+        """
+        Increments one statistic from any thread.
+        """
+        self.counters[name].add(amount)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current value of every statistic.
+        """
+        return {name: counter.value() for name, counter in self.counters.items()}
+
+
+class StripedLock:
+    """
+    A fixed set of locks picked by key hash. Per-destination state is guarded without one
+    global lock and without allocating a lock for every destination.
+    """
+
+    def __init__(self, stripes: int = 64):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key) -> threading.Lock:
+        return self.locks[hash(key) % len(self.locks)]
+
+
+class ThreadLocalPool:
+    """
+    Builds one instance of an object per thread on first use, e.g. a cipher,
+    so objects with internal state are never shared between threads.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.local = threading.local()
+
+    def get(self):
+        """
+        Returns the calling thread's instance, creating it if needed.
+        """
+        instance = getattr(self.local, "instance", None)
+        if instance is None:
+            instance = self.local.instance = self.factory()
+        return instance
+
+
+class AdvancedCommunicationProtocol:
+    """
+    One instance can be shared by any number of sender and receiver threads.
+    Packet IDs, statistics and ciphers are per-thread or sharded, per-destination state is
+    guarded by striped locks, and no code path relies on the GIL for atomicity, so the same
+    code scales on free-threaded CPython builds.
+    """
+
+    MAX_RETRIES = 3  # Maximum number of retries
+
+    # ... existing code ...
+
+    def __init__(self, encryption_key: str = None, protocol_version: str = "1.0"):
+        # ... existing code ...
+        self.packet_ids = PacketIdAllocator()
+        self.stats = ProtocolStats()
+        self.ciphers = ThreadLocalPool(self._new_cipher)
+        self.destination_locks = StripedLock()
+        self.rtt_in_flight = {}  # packet_id -> (destination, send time, retransmitted); single get/set/pop only
+
+    def _new_cipher(self):
+        from cryptography.fernet import Fernet
+        return Fernet(self.encryption_key)
+
+    @property
+    def cipher_suite(self):
+        """
+        Fernet object of the calling thread, created the first time that thread needs it.
+        """
+        return self.ciphers.get()
+
+    def create_packet(self, data: dict) -> dict:
+        """
+        Creates a new packet with timestamp, packet ID, and data. Safe to call from any thread.
+        """
+        packet = {
+            "packet_id": self.packet_ids.next_id(),
+            "timestamp": int(time.time()),
+            "protocol_version": self.protocol_version,
+            "data": data,
+            "error_code": None  # Initially no error
+        }
+        return packet
+
+    def send_packet(self, packet: dict, destination: str):
+        """
+        Sends a packet to a destination, retrying up to MAX_RETRIES times in a loop.
+        Safe to call concurrently on one instance as long as each packet dict belongs to one thread.
+        """
+        packet['data'] = self.encrypt_data(packet['data'])
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            packet["error_code"] = None
+            self.rtt_in_flight[packet["packet_id"]] = (destination, time.monotonic(), attempt > 0)
+
+            # ... existing code ...
+
+            if packet.get("error_code") is None:
+                self.stats.add("packets_sent")
+                self.stats.add("bytes_sent", len(packet['data']))
+                return
+            self.stats.add("errors")
+            if attempt == self.MAX_RETRIES:
+                break
+
+            with self.destination_locks(destination):
+                delay = self.rtt.timeout(destination)
+                self.rtt.on_timeout(destination)
+            self.stats.add("retries")
+            print(f"Error occurred while sending packet, retrying in {delay:.3f} seconds ({attempt + 1}/{self.MAX_RETRIES})...")
+            time.sleep(delay)  # Wait before retrying; no lock is held here
+
+        self.rtt_in_flight.pop(packet["packet_id"], None)
+
+    def record_ack(self, packet_id: int):
+        """
+        Records the round trip of an acknowledged packet, skipping retransmitted ones (Karn's rule).
+        """
+        entry = self.rtt_in_flight.pop(packet_id, None)
+        if entry is None:
+            return
+        destination, sent_at, retransmitted = entry
+        if not retransmitted:
+            with self.destination_locks(destination):
+                self.rtt.sample(destination, time.monotonic() - sent_at)
+
+    def receive_packet(self, packet: dict) -> dict:
+        """
+        Receives a packet and performs basic validation. Safe to call from any thread.
+        """
+        self.stats.add("packets_received")
+
+        # ... existing code ...
+
+
+class StressProtocol(AdvancedCommunicationProtocol):
+    """
+    Concrete protocol for the stress test. It reuses the real circuit breaker and deduplication
+    code of the other modules, tags packets with the integrity engine instead of encrypting them
+    (no Fernet needed) and uses the shared send scheduler as the wire.
+    """
+
+    HASH_PREFIX_LENGTH = DedupProtocol.HASH_PREFIX_LENGTH
+    circuit_breaker = BreakerProtocol.circuit_breaker
+    dedup_key = DedupProtocol.dedup_key
+    receive_deduplicated = DedupProtocol.receive_packet
+
+    def __init__(self, engine: IntegrityEngine):
+        self.encryption_key = None
+        self.protocol_version = "1.0"
+        super().__init__()
+        self.integrity = engine
+        self.rtt = RttTable()
+        self.circuit_breakers = {}
+        self.dedup_cache = DeduplicationCache(max_entries=1 << 30)
+        self.exactly_once = False
+        self.packet_handler = None
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.limiter = TokenBucketTable(rate=1e9, burst=1e9)
+        self.scheduler = DeficitRoundRobinScheduler(limits={priority: 1 << 30 for priority in Priority})
+
+    def encrypt_data(self, data: dict) -> bytes:
+        body = json.dumps(data).encode("utf-8")
+        return body + self.integrity.compute_tag(body)
+
+    def send_packet(self, packet: dict, destination: str):
+        breaker = self.circuit_breaker(destination)
+        if not breaker.allow_request() or self.limiter.try_acquire(destination):
+            raise AssertionError(f"Send to {destination} was refused")
+        super().send_packet(packet, destination)
+        self.scheduler.enqueue((packet, destination), Priority.BULK, len(packet["data"]))
+        breaker.record(None)
+
+    def receive_packet(self, packet: dict, sender: str = None) -> dict:
+        if self.receive_deduplicated(packet, sender) is None:
+            return None
+        super().receive_packet(packet)
+        return packet
+
+
+class IntrusionStressProtocol(AsyncIdsProtocol):
+    """
+    Receive path of the stress test for the shared intrusion state: the real replay check and
+    analyzer workers of async_ids, archiving into the real packet archive from both the receive
+    threads and the workers. Packets whose data is marked "flagged" are reported as intrusions.
+    """
+
+    archive_received = ArchiveProtocol.receive_packet
+    log_intrusion_attempt = ArchiveProtocol.log_intrusion_attempt
+
+    def __init__(self, engine: IntegrityEngine, archive: PacketArchive, queue_size: int):
+        self.integrity = engine
+        self.archive = archive
+        super().__init__(async_intrusion_detection=False)
+        # Room for every packet, so none escapes the analysis count
+        self.intrusion_analyzer = IntrusionAnalyzer(
+            heuristics=[self.intrusion_heuristic],
+            on_verdict=self.handle_verdict,
+            queue_size=queue_size,
+        )
+
+    def detect_intrusion(self, packet: dict) -> bool:
+        return bool(packet["data"].get("flagged"))
+
+    def tag(self, packet: dict) -> dict:
+        packet["hash"] = self.integrity.compute_tag(json.dumps(packet, sort_keys=True, default=str).encode("utf-8"))
+        return packet
+
+    def receive_packet(self, packet: dict, sender: str = None) -> dict:
+        self.archive_received(packet, sender)
+        return super().receive_packet(packet, sender)
+
+
+def run_workers(threads: int, target) -> list:
+    """
+    Runs target(index) on the given number of threads, released together, and returns their exceptions.
+    """
+    failures = []
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            target(index)
+        except Exception as e:
+            failures.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return failures
+
+
+def check_shared_state(threads: int, count: int = 2000, destinations: int = 16):
+    """
+    Stress test for the shared receive-side structures: the packet archive (appended to by receive
+    threads and intrusion workers while being queried), the replay check, the fragment reassembler,
+    the stream multiplexer and demultiplexer, and the selective-acknowledgement ID sets.
+    Every structure is hit by all threads at once and then checked for lost, doubled or misaligned entries.
+    """
+    engine = IntegrityEngine(b"stress-test-key")
+    total = threads * count
+    flagged = {packet_id for packet_id in range(1, total + 1) if packet_id % 7 == 0}
+
+    def source(packet_id):
+        return f"intruder-{packet_id}" if packet_id in flagged else f"node-{packet_id % destinations}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = PacketArchive(directory, segment_rows=256)  # Small segments, so seals race with appends
+        protocol = IntrusionStressProtocol(engine, archive, queue_size=total)
+        analyzer = protocol.intrusion_analyzer
+
+        def receive(index):
+            for packet_id in range(index + 1, total + 1, threads):
+                packet = protocol.tag({
+                    "packet_id": packet_id,
+                    "timestamp": 0,
+                    "protocol_version": "1.0",
+                    "data": {"flagged": packet_id in flagged},
+                    "error_code": None,
+                })
+                for _ in range(2):  # The second copy must be caught by the replay check
+                    protocol.receive_packet(dict(packet), source(packet_id))
+                if packet_id % 64 == index + 1:
+                    records = archive.query(packet_id=packet_id)
+                    if len(records) < 2 or any(record["source"] != source(packet_id) for record in records):
+                        raise AssertionError(f"Archive returned {records} for packet {packet_id}")
+
+        failures = run_workers(threads, receive)
+        protocol.close()
+        records = archive.query()
+        intrusions = archive.query(error_code=ErrorCode.UNAUTHORIZED_ACCESS.value)
+        archive.close()
+    if failures:
+        raise AssertionError(f"Archive stress failed with {threads} threads: {failures[0]!r}")
+    if len(records) != 2 * total + len(flagged) or any(record["source"] != source(record["packet_id"]) for record in records):
+        raise AssertionError(f"Archive holds {len(records)} rows or misaligned columns with {threads} threads")
+    if sorted(record["packet_id"] for record in intrusions) != sorted(flagged):
+        raise AssertionError(f"{len(intrusions)} intrusions archived for {len(flagged)} flagged packets")
+    if len(protocol.replay_window) != total or analyzer.analyzed != total or analyzer.dropped or protocol.replay_in_flight:
+        raise AssertionError(f"Replay check accepted {len(protocol.replay_window)} packets and {analyzer.analyzed} "
+                             f"were analyzed, expected {total}, with {threads} threads")
+
+    # Every thread adds a share of the fragments of every message from one sender
+    messages = [bytes([m % 251]) * (300 + m % 700) for m in range(min(count, 512))]
+    fragments = [fragment_frame(m, frame, mtu=64) for m, frame in enumerate(messages)]
+    reassembler = FragmentReassembler(max_bytes=1 << 30, max_pending=len(messages))
+    completed = []
+
+    def reassemble(index):
+        for m, parts in enumerate(fragments):
+            for fragment in parts[index::threads]:
+                frame = reassembler.add_fragment(bytes(fragment), "peer")
+                if frame is not None:
+                    completed.append((m, frame))
+            if m % 16 == 0:
+                reassembler.nack_due()
+
+    failures = run_workers(threads, reassemble)
+    if failures or sorted(completed) != list(enumerate(messages)) or reassembler.pending or reassembler.buffered_bytes:
+        raise AssertionError(f"Reassembled {len(completed)} of {len(messages)} messages with {threads} threads "
+                             f"({failures[:1]}, {len(reassembler.pending)} left pending)")
+
+    # Threads queue on shared streams, send what the credit allows and apply the receiver's window updates
+    mux = StreamMultiplexer()
+    demux = StreamDemultiplexer()
+    delivered = []
+
+    def pump():
+        packet = mux.next_packet()
+        while packet is not None:
+            for ready in demux.receive(packet):
+                delivered.append((ready["stream_id"], ready["stream_seq"]))
+            update = demux.window_update(packet["stream_id"])
+            if update is not None:
+                mux.grant_credit(update["stream_id"], update["limit"])
+            packet = mux.next_packet()
+
+    def stream(index):
+        for n in range(count):
+            mux.enqueue(n % 8, {"data": (index, n)})
+            pump()
+
+    failures = run_workers(threads, stream)
+    while len(delivered) < total and not failures:
+        # Streams left with less than half a window consumed only get credit from the refresh
+        for update in demux.refresh_updates(time.monotonic() + CREDIT_REFRESH):
+            mux.grant_credit(update["stream_id"], update["limit"])
+        before = len(delivered)
+        pump()
+        if len(delivered) == before:
+            break
+    if failures or len(delivered) != total or len(set(delivered)) != total:
+        raise AssertionError(f"Streams delivered {len(delivered)} packets ({len(set(delivered))} unique), "
+                             f"expected {total}, with {threads} threads")
+
+    # Threads record interleaved IDs while others answer and trim SACK requests
+    sack = SackProtocol()
+    sack.send_control = lambda message, destination: None
+
+    def acknowledge(index):
+        for packet_id in range(index + 1, total + 1, threads):
+            sack.receive_packet({"packet_id": packet_id, "error_code": None}, "peer")
+            if packet_id % 256 == index + 1:
+                sack.receive_control({"type": "sack_request", "low": 1, "high": total}, "peer")
+
+    failures = run_workers(threads, acknowledge)
+    ranges = sack.build_ack("peer", 1, total)["ranges"]
+    if failures or ranges != [(1, total)]:
+        raise AssertionError(f"SACK reports {ranges[:4]} for IDs 1..{total} with {threads} threads")
+
+
+def run(packets_per_thread: int = 20000, thread_counts: tuple = (1, 2, 4, 8), destinations: int = 16):
+    """
+    Stress test: many threads share one protocol instance, each sending packets with send_packet
+    and receiving whatever is queued with receive_packet, every packet twice so the second copy
+    must be dropped as a duplicate. Checks that no ID is handed out twice, that every packet is
+    delivered exactly once and that no count is lost, then runs check_shared_state() and reports
+    throughput for each thread count.
+    """
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    engine = IntegrityEngine(b"stress-test-key")
+    baseline = None
+
+    for threads in thread_counts:
+        protocol = StressProtocol(engine)
+        delivered = [None] * threads
+        failures = []
+        barrier = threading.Barrier(threads + 1)
+
+        def deliver(ids):
+            item = protocol.scheduler.dequeue()
+            if item is None:
+                return
+            packet, destination = item
+            protocol.record_ack(packet["packet_id"])
+            for _ in range(2):  # The second copy is a retransmission
+                if protocol.receive_packet(dict(packet), sender=destination) is not None:
+                    ids.append(packet["packet_id"])
+
+        def worker(index):
+            ids = delivered[index] = []
+            barrier.wait()
+            try:
+                for n in range(packets_per_thread):
+                    packet = protocol.create_packet({"sensor": index, "reading": n})
+                    protocol.send_packet(packet, f"node-{n % destinations}")
+                    deliver(ids)
+            except Exception as e:
+                failures.append(e)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        # Every dropped duplicate is printed; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in workers:
+                thread.join()
+            while len(protocol.scheduler):
+                deliver(delivered[0])
+        elapsed = time.perf_counter() - start
+
+        if failures:
+            raise AssertionError(f"{len(failures)} threads failed with {threads} threads: {failures[0]!r}")
+        total = threads * packets_per_thread
+        ids = [packet_id for thread_ids in delivered for packet_id in thread_ids]
+        if len(ids) != total or len(set(ids)) != total:
+            raise AssertionError(f"{len(ids)} deliveries of {len(set(ids))} unique packets, expected {total}, "
+                                 f"with {threads} threads")
+        stats = protocol.stats.snapshot()
+        if stats["packets_sent"] != total or stats["packets_received"] != total:
+            raise AssertionError(f"Counters lost updates with {threads} threads: {stats}")
+        if len(protocol.dedup_cache) != total or protocol.rtt_in_flight:
+            raise AssertionError(f"Dedup cache or RTT state is inconsistent with {threads} threads")
+        if len(protocol.circuit_breakers) != destinations:
+            raise AssertionError(f"{len(protocol.circuit_breakers)} circuit breakers for {destinations} destinations")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_shared_state(threads, destinations=destinations)
+
+        rate = total / elapsed
+        baseline = baseline or rate
+        print(f"{threads:2} threads: {rate:12,.0f} packets/s  ({rate / baseline:.2f}x)  OK")
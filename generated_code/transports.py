@@ -0,0 +1,365 @@
+import os
+import selectors
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+FRAME_LENGTH = struct.Struct("!I")  # Length prefix for frames on stream sockets
+MAX_DATAGRAM = 65507
+
+
+def parse_address(address: str) -> tuple:
+    """
+    Splits "host:port" into a (host, port) tuple.
+    """
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+class Transport:
+    """
+    Base class for the ways a protocol instance can move encoded frames to a destination.
+    """
+
+    encrypted = True  # Whether the protocol must encrypt frames before handing them over
+
+    def send(self, frame: bytes, destination: str):
+        """
+        Sends one frame to the destination.
+        """
+        self.send_many([frame], destination)
+
+    def send_many(self, frames: list, destination: str):
+        """
+        Sends a batch of frames to the same destination with as few system calls as possible.
+        """
+        raise NotImplementedError
+
+    def bind(self, address: str):
+        """
+        Starts accepting frames addressed to this transport.
+        """
+        raise NotImplementedError
+
+    def receive(self, timeout: float = None) -> list:
+        """
+        Returns the frames received so far, waiting up to timeout seconds if there are none.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Releases sockets and other resources.
+        """
+
+
+class InMemoryTransport(Transport):
+    """
+    Delivers frames between transports in the same process, mainly for tests and benchmarks.
+    """
+
+    mailboxes = defaultdict(deque)  # address -> queued frames, shared by every instance
+    condition = threading.Condition()
+
+    def __init__(self):
+        self.address = None
+
+    def send_many(self, frames: list, destination: str):
+        with self.condition:
+            self.mailboxes[destination].extend(frames)
+            self.condition.notify_all()
+
+    def bind(self, address: str):
+        self.address = address
+
+    def receive(self, timeout: float = None) -> list:
+        with self.condition:
+            mailbox = self.mailboxes[self.address]
+            if not mailbox:
+                self.condition.wait(timeout)
+            frames = list(mailbox)
+            mailbox.clear()
+        return frames
+
+
+class StreamSocketTransport(Transport):
+    """
+    Length-prefixed frames over connected stream sockets (TCP or Unix domain).
+    A batch is written with a single sendmsg() gather call.
+    """
+
+    family = None
+
+    def __init__(self):
+        self.connections = {}  # destination -> connected socket
+        self.listener = None
+        self.selector = None
+        self.buffers = {}  # accepted socket -> bytearray of unparsed input
+
+    def socket_address(self, address: str):
+        raise NotImplementedError
+
+    def connect(self, destination: str) -> socket.socket:
+        sock = self.connections.get(destination)
+        if sock is None:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.connect(self.socket_address(destination))
+            self.configure(sock)
+            self.connections[destination] = sock
+        return sock
+
+    def configure(self, sock: socket.socket):
+        pass
+
+    def disconnect(self, destination: str):
+        sock = self.connections.pop(destination, None)
+        if sock is not None:
+            sock.close()
+
+    def send_many(self, frames: list, destination: str):
+        """
+        On a socket error the connection is dropped and the frames that were not completely
+        written are sent once more over a new connection; a second failure is raised.
+        """
+        try:
+            self._write(self.connect(destination), frames)
+        except OSError as e:
+            self.disconnect(destination)
+            print(f"Connection to {destination} failed ({e}), reconnecting...")
+            frames = frames[getattr(e, "frames_written", 0):]
+            try:
+                self._write(self.connect(destination), frames)
+            except OSError:
+                self.disconnect(destination)
+                raise
+
+    def _write(self, sock: socket.socket, frames: list):
+        buffers = []
+        for frame in frames:
+            buffers.append(FRAME_LENGTH.pack(len(frame)))
+            buffers.append(frame)
+        popped = 0
+        # sendmsg may write only part of the batch, so keep going until everything is out
+        try:
+            while buffers:
+                sent = sock.sendmsg(buffers[:1024])  # Stay under the IOV_MAX limit
+                while sent:
+                    if sent >= len(buffers[0]):
+                        sent -= len(buffers.pop(0))
+                        popped += 1
+                    else:
+                        buffers[0] = buffers[0][sent:]
+                        sent = 0
+        except OSError as e:
+            e.frames_written = popped // 2  # Frames whose header and body both went out
+            raise
+
+    def bind(self, address: str):
+        self.listener = socket.socket(self.family, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.socket_address(address))
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+
+    def receive(self, timeout: float = None) -> list:
+        frames = []
+        for key, _ in self.selector.select(timeout):
+            sock = key.fileobj
+            if sock is self.listener:
+                conn, _ = sock.accept()
+                conn.setblocking(False)
+                self.configure(conn)
+                self.buffers[conn] = bytearray()
+                self.selector.register(conn, selectors.EVENT_READ)
+                continue
+
+            data = sock.recv(262144)
+            if not data:
+                self.selector.unregister(sock)
+                del self.buffers[sock]
+                sock.close()
+                continue
+            buffer = self.buffers[sock]
+            buffer += data
+            offset = 0
+            while len(buffer) - offset >= FRAME_LENGTH.size:
+                (length,) = FRAME_LENGTH.unpack_from(buffer, offset)
+                end = offset + FRAME_LENGTH.size + length
+                if end > len(buffer):
+                    break
+                frames.append(bytes(buffer[offset + FRAME_LENGTH.size:end]))
+                offset = end
+            del buffer[:offset]
+        return frames
+
+    def close(self):
+        for sock in list(self.connections.values()) + list(self.buffers):
+            sock.close()
+        self.connections.clear()
+        self.buffers.clear()
+        if self.listener is not None:
+            self.selector.close()
+            self.listener.close()
+            self.listener = None
+
+
+class TCPTransport(StreamSocketTransport):
+    family = socket.AF_INET
+
+    def socket_address(self, address: str):
+        return parse_address(address)
+
+    def configure(self, sock: socket.socket):
+        # Frames are already batched, so don't let Nagle delay small control packets
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class UnixSocketTransport(StreamSocketTransport):
+    family = getattr(socket, "AF_UNIX", None)
+
+    def socket_address(self, address: str):
+        return address  # A filesystem path
+
+    def bind(self, address: str):
+        if os.path.exists(address):
+            os.unlink(address)
+        super().bind(address)
+
+
+class UDPTransport(Transport):
+    """
+    One frame per datagram; frames larger than a datagram must be fragmented first (see fragmentation.py).
+    Python has no sendmmsg(), so a batch is a tight loop of sendto() calls on one socket.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.bound = False
+
+    def send_many(self, frames: list, destination: str):
+        address = parse_address(destination)
+        sendto = self.sock.sendto
+        for frame in frames:
+            if len(frame) > MAX_DATAGRAM:
+                raise ValueError(f"Frame of {len(frame)} bytes does not fit in a UDP datagram")
+            sendto(frame, address)
+
+    def bind(self, address: str):
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(parse_address(address))
+        self.bound = True
+
+    def receive(self, timeout: float = None) -> list:
+        self.sock.settimeout(timeout)
+        try:
+            frames = [self.sock.recv(MAX_DATAGRAM)]
+        except socket.timeout:
+            return []
+        # Drain whatever else is already queued without blocking
+        self.sock.setblocking(False)
+        try:
+            while True:
+                frames.append(self.sock.recv(MAX_DATAGRAM))
+        except BlockingIOError:
+            pass
+        return frames
+
+    def close(self):
+        self.sock.close()
+
+
+TRANSPORTS = {
+    "memory": InMemoryTransport,
+    "tcp": TCPTransport,
+    "udp": UDPTransport,
+    "unix": UnixSocketTransport,
+}
+
+
+def create_transport(name: str, **options) -> Transport:
+    """
+    Creates a transport by its configuration name.
+    """
+    transport_class = TRANSPORTS.get(name)
+    if transport_class is None:
+        raise ValueError(f"Unknown transport: {name} (expected one of {', '.join(TRANSPORTS)})")
+    return transport_class(**options)
+
+
+class AdvancedCommunicationProtocol:
+    # ... existing code ...
+
+    def __init__(self, transport: str = "memory", transport_options: dict = None):
+        # ... existing code ...
+        self.transport = create_transport(transport, **(transport_options or {}))
+
+    def transmit(self, frame: bytes, destination: str):
+        """
+        Hands one encoded frame to the configured transport.
+        """
+        self.transport.send(frame, destination)
+
+    def transmit_batch(self, frames: list, destination: str):
+        """
+        Hands a batch of encoded frames for one destination to the configured transport.
+        """
+        self.transport.send_many(frames, destination)
+
+    def send_packet(self, packet: dict, destination: str, retries=0):
+        """
+        Sends a packet to a destination through the configured transport.
+        """
+        # ... existing code ...
+
+        self.transmit(self.encrypt_data(packet), destination)
+
+        # ... existing code ...
+
+
+def run(count: int = 200000, frame_size: int = 256, batch_size: int = 64):
+    """
+    Compares transport throughput on localhost by pushing count frames through each one.
+    """
+    frame = os.urandom(frame_size)
+    batch = [frame] * batch_size
+    count = count // batch_size * batch_size
+    socket_dir = tempfile.mkdtemp()
+    addresses = {
+        "memory": "bench",
+        "tcp": "127.0.0.1:47001",
+        "udp": "127.0.0.1:47002",
+        "unix": os.path.join(socket_dir, "bench.sock"),
+    }
+
+    for name, address in addresses.items():
+        receiver = create_transport(name)
+        sender = create_transport(name)
+        receiver.bind(address)
+        received = 0
+
+        def drain():
+            nonlocal received
+            idle_since = time.monotonic()
+            while received < count and time.monotonic() - idle_since < 1.0:
+                frames = receiver.receive(timeout=0.1)
+                if frames:
+                    received += len(frames)
+                    idle_since = time.monotonic()
+
+        thread = threading.Thread(target=drain)
+        thread.start()
+        start = time.perf_counter()
+        for _ in range(count // batch_size):
+            sender.send_many(batch, address)
+        thread.join()
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:7} {received / elapsed:12,.0f} frames/s  "
+              f"{received * frame_size / elapsed / 1e6:8.1f} MB/s  ({count - received} lost)")
+        sender.close()
+        receiver.close()